@@ -0,0 +1,41 @@
+"""
+Compares two benchmark result files written by benchmarks.run, and
+exits with status 1 if any benchmark got slower than the threshold.
+"""
+import sys
+import json
+import argparse
+
+def _key(result):
+    return result['name'], json.dumps(result['params'], sort_keys=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='maximum allowed ratio after/before (default: %(default)s)')
+    args = parser.parse_args()
+
+    with open(args.before) as fp:
+        before = dict((_key(r), r) for r in json.load(fp)['results'])
+    with open(args.after) as fp:
+        after = json.load(fp)['results']
+
+    regressions = 0
+    for result in after:
+        old = before.get(_key(result))
+        if old is None:
+            continue
+        ratio = result['min'] / old['min']
+        flag = ''
+        if ratio > args.threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        print('{:<25} {:<55} {:>10.3f} us -> {:>10.3f} us  x{:.2f}{}'.format(
+              result['name'], _key(result)[1],
+              old['min'] * 1e6, result['min'] * 1e6, ratio, flag))
+    sys.exit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Measures the request throughput of a running hub.
+
+Starts a number of concurrent clients that send requests for the given
+duration, and prints the number of requests per second and latency
+percentiles per endpoint. Endpoints are given as METHOD:PATH; POST
+requests send an empty JSON object. To see how a slow request affects
+the others, mix in a slow endpoint, e.g.:
+
+    python -m benchmarks.load --email admin@example.com --password secret \\
+        -e GET:/api/info/1.0/hello -e POST:/api/utility/1.0/debug/info
+
+Run it once against each server configuration that is to be compared.
+"""
+import sys
+import json
+import time
+import argparse
+import threading
+import itertools
+import statistics
+import urllib.request
+import urllib.error
+
+def login(base_url, email, password):
+    body = json.dumps({'email': email, 'password': password}).encode('utf-8')
+    request = urllib.request.Request(base_url + '/api/auth/1.0/session/start',
+                                     data=body,
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read().decode('utf-8'))['sid']
+
+def make_request(base_url, endpoint, sid):
+    method, path = endpoint.split(':', 1)
+    data = b'{}' if method == 'POST' else None
+    request = urllib.request.Request(base_url + path, data=data, method=method)
+    request.add_header('Content-Type', 'application/json')
+    if sid:
+        request.add_header('Cookie', 'sid=' + sid)
+    return request
+
+def client(base_url, endpoints, sid, deadline, results):
+    for endpoint in endpoints:
+        request = make_request(base_url, endpoint, sid)
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                response.read()
+            ok = True
+        except (urllib.error.URLError, OSError):
+            ok = False
+        results.append((endpoint, ok, time.perf_counter() - start))
+        if time.monotonic() >= deadline:
+            return
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-u', '--url', default='http://localhost:80')
+    parser.add_argument('-e', '--endpoint', action='append', dest='endpoints',
+                        help='METHOD:PATH; may be repeated (default: GET:/api/info/1.0/hello)')
+    parser.add_argument('-c', '--concurrency', type=int, default=16)
+    parser.add_argument('-d', '--duration', type=float, default=10)
+    parser.add_argument('--email')
+    parser.add_argument('--password')
+    args = parser.parse_args()
+    endpoints = args.endpoints or ['GET:/api/info/1.0/hello']
+    base_url = args.url.rstrip('/')
+    sid = None
+    if args.email:
+        sid = login(base_url, args.email, args.password)
+
+    # Each client cycles through the endpoints, starting at a different one.
+    results = []
+    deadline = time.monotonic() + args.duration
+    threads = []
+    for i in range(args.concurrency):
+        order = endpoints[i % len(endpoints):] + endpoints[:i % len(endpoints)]
+        thread = threading.Thread(target=client,
+                                  args=(base_url, itertools.cycle(order),
+                                        sid, deadline, results))
+        thread.start()
+        threads.append(thread)
+    start = time.monotonic()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    print('{} clients, {:.1f}s: {:.1f} requests/s'.format(
+          args.concurrency, elapsed, len(results) / elapsed))
+    print('{:<45} {:>7} {:>7} {:>9} {:>9} {:>9}'.format(
+          'endpoint', 'count', 'errors', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for endpoint in endpoints:
+        times = [t for e, ok, t in results if e == endpoint]
+        errors = sum(1 for e, ok, _ in results if e == endpoint and not ok)
+        if not times:
+            continue
+        print('{:<45} {:>7} {:>7} {:>9.1f} {:>9.1f} {:>9.1f}'.format(
+              endpoint, len(times), errors,
+              statistics.median(times) * 1e3,
+              percentile(times, 95) * 1e3,
+              percentile(times, 99) * 1e3))
+    sys.exit(1 if not results else 0)
+
+if __name__ == '__main__':
+    main()
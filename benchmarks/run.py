@@ -0,0 +1,171 @@
+"""
+Microbenchmarks for the hub's hot functions.
+
+Runs against an in-memory Sqlite database and Mock.GPIO, and prints the
+results as JSON. To compare two runs:
+
+    python -m benchmarks.run -o before.json
+    (change things)
+    python -m benchmarks.run -o after.json
+    python -m benchmarks.compare before.json after.json
+"""
+import os
+import sys
+import json
+import time
+import timeit
+import sqlite3
+import argparse
+import platform
+import statistics
+from datetime import datetime, timedelta
+
+# The hub reads its configuration at import time.
+os.environ.setdefault('CRYPTO_SALT', 'benchmark')
+os.environ.setdefault('SUPPORT_EMAIL', 'none@example.com')
+os.environ.setdefault('SMTP_SERVER_AND_PORT', 'localhost:25')
+os.environ.setdefault('SMTP_USER', '')
+os.environ.setdefault('SMTP_PASSWORD', '')
+os.environ.setdefault('DB_FILE', 'file:doorman-bench?mode=memory&cache=shared')
+os.environ['DB_HOST'] = ''
+os.environ['EVENT_RETENTION'] = ''
+
+from doormanhub import app, const, __version__
+from doormanhub.db import db, User, Session, Action, Tag, Event
+from doormanhub.dbutil import model_to_dict, get_db_object_list
+from doormanhub.logs import log, writer
+from doormanhub.util import hash_password
+from doormanhub.api.auth import attempt_auth, session_cache
+from doormanhub.api.action import start_action_from_id
+
+class Runner(object):
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = []
+
+    def bench(self, name, func, **params):
+        timer = timeit.Timer(func)
+        number, _ = timer.autorange()
+        times = [t / number for t in timer.repeat(self.repeat, number)]
+        result = {'name': name,
+                  'params': params,
+                  'number': number,
+                  'min': min(times),
+                  'median': statistics.median(times)}
+        self.results.append(result)
+        print('{:<40} {:<40} {:>12.3f} us'.format(
+              name, json.dumps(params, sort_keys=True), result['min'] * 1e6),
+              file=sys.stderr)
+
+def fill(size):
+    """
+    Resets all tables to the given number of rows each.
+    """
+    now = datetime.now()
+    with db.atomic():
+        for model in (Tag, Action, Session, User, Event):
+            model.delete().execute()
+        User.insert_many([{'email': 'user{}@example.com'.format(i),
+                           'full_name': 'User {}'.format(i),
+                           'password': hash_password('secret')}
+                          for i in range(size)]).execute()
+        Action.insert_many([{'name': 'action{}'.format(i),
+                             'device_id': 'GPIO-Relais-Hat',
+                             'actor_id': '1',
+                             'params': {'on': i % 2 == 0}}
+                            for i in range(size)]).execute()
+        action_ids = [a.id for a in Action.select(Action.id)]
+        Tag.insert_many([{'id': 'TAG{}'.format(i), 'action': action_id}
+                         for i, action_id in enumerate(action_ids)]).execute()
+        Event.insert_many([{'user_id': 'user{}@example.com'.format(i % 50),
+                            'severity': ('debug', 'info', 'error')[i % 3],
+                            'event_text': 'event {}'.format(i),
+                            'timestamp': now - timedelta(seconds=i)}
+                           for i in range(size)]).execute()
+
+def bench_list(runner, model, size):
+    with app.test_request_context(json={'limit': 25}):
+        runner.bench('get_db_object_list', lambda: get_db_object_list(model),
+                     model=model.__name__, size=size, mode='first page')
+    deep = {'limit': 25, 'offset': max(size - 25, 0)}
+    with app.test_request_context(json=deep):
+        runner.bench('get_db_object_list', lambda: get_db_object_list(model),
+                     model=model.__name__, size=size, mode='offset, last page')
+    big = {'limit': min(size, 500), 'total': 'none'}
+    with app.test_request_context(json=big):
+        runner.bench('get_db_object_list', lambda: get_db_object_list(model),
+                     model=model.__name__, size=size, mode='big page')
+    with app.test_request_context(json={'limit': max(size - 25, 1), 'total': 'none'}):
+        cursor = json.loads(get_db_object_list(model).get_data())['next']
+    if cursor:
+        cursor['limit'] = 25
+        with app.test_request_context(json=cursor):
+            runner.bench('get_db_object_list', lambda: get_db_object_list(model),
+                         model=model.__name__, size=size, mode='keyset, last page')
+
+def bench_auth(runner):
+    user = User.create(email='bench@example.com', password=hash_password('x'))
+    session = Session.create(user=user, expires=datetime.now() + timedelta(days=1))
+    with app.test_request_context(json={'sid': session.id}):
+        runner.bench('attempt_auth', attempt_auth, cache='hit')
+        def uncached():
+            session_cache.clear()
+            attempt_auth()
+        runner.bench('attempt_auth', uncached, cache='miss')
+    with app.test_request_context(json={}):
+        runner.bench('attempt_auth', attempt_auth, cache='no sid')
+
+def bench_model_to_dict(runner):
+    for model in (User, Action, Tag, Event):
+        obj = model.select().first()
+        runner.bench('model_to_dict', lambda: model_to_dict(obj),
+                     model=model.__name__)
+
+def bench_log(runner):
+    runner.bench('logs.log', lambda: log('bench', 'debug', 'benchmark', 1))
+    writer.flush()
+
+def bench_start_action(runner):
+    action = Action.select().first()
+    with app.test_request_context(json={}):
+        runner.bench('start_action_from_id',
+                     lambda: start_action_from_id(action.id))
+    writer.flush()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('-o', '--output', help='write JSON to this file')
+    parser.add_argument('--sizes', default='100,1000,10000',
+                        help='comma separated table sizes (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(',')]
+
+    runner = Runner(args.repeat)
+    runner.bench('hash_password', lambda: hash_password('correct horse'))
+
+    # Keep one connection open, or the in-memory database disappears.
+    keepalive = sqlite3.connect(const.db_file, uri=True)
+    for size in sizes:
+        fill(size)
+        for model in (User, Action, Tag, Event):
+            bench_list(runner, model, size)
+    bench_model_to_dict(runner)
+    bench_auth(runner)
+    bench_log(runner)
+    bench_start_action(runner)
+    keepalive.close()
+
+    output = {'version': __version__,
+              'python': platform.python_version(),
+              'machine': platform.machine(),
+              'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+              'results': runner.results}
+    if args.output:
+        with open(args.output, 'w') as fp:
+            json.dump(output, fp, indent=2)
+    else:
+        json.dump(output, sys.stdout, indent=2)
+
+if __name__ == '__main__':
+    main()
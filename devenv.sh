@@ -1,5 +1,5 @@
 export CRYPTO_SALT=abcdefg
-export GOOGLE_API_KEY=abcdefg
+export GOOGLE_CLIENT_ID=
 export SUPPORT_EMAIL=none@gmail.com
 export SMTP_SERVER_AND_PORT=smtp.gmail.com:587
 export SMTP_USER=
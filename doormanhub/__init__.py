@@ -1,2 +1,8 @@
-from .hub import app
+import os
 from .version import __version__
+
+# The web app loads the drivers (or connects to the hardware daemon) when
+# it is imported, so the hardware daemon and the asset build (see
+# assets.py) must not import it.
+if os.environ.get('DOORMAN_ROLE', 'web') == 'web':
+    from .hub import app
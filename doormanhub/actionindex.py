@@ -0,0 +1,180 @@
+import time
+import threading
+from collections import namedtuple
+from . import const, invalidation
+from .db import Action, CacheGeneration, Tag
+
+# An action together with the device and actor it refers to. params is
+# the decoded Action.params. device and actor are None if the action
+# references hardware that is not currently available.
+ResolvedAction = namedtuple('ResolvedAction', 'action device actor params')
+
+def _action_key(action_id):
+    try:
+        return int(action_id)
+    except (TypeError, ValueError):
+        return action_id
+
+class ActionIndex(object):
+    """
+    In-process index of all actions and NFC tags, so that starting an
+    action (e.g. from a tag) needs neither DB queries nor JSON decoding.
+    Lookups that miss the index fall back to the database, so rows
+    added by other processes are still found. Devices and actors are
+    looked up in the device registry on every call, since a registry
+    mirror (see hwclient.RegistryMirror) replaces them when they change.
+
+    Changes made through update_*() and remove_*() bump a CacheGeneration
+    counter in the database, and are relayed to the other web workers
+    (see invalidation.py). Lookups compare the counter with the generation
+    the index was filled at, at most once per check_interval seconds and
+    right after a relayed change, and drop the index if they differ.
+    Actions and tags removed by another process are therefore not started
+    here for longer than that.
+    """
+    generation_name = 'actions'
+
+    def __init__(self, check_interval=1):
+        self.devices = {}
+        self.check_interval = check_interval
+        self._actions = {}
+        self._tags = {}
+        self._generation = None
+        self._checked = None
+        self._expired = 0
+        self._lock = threading.Lock()
+
+    def _resolve(self, action):
+        device = self.devices.get(action.device_id)
+        actor = None
+        if device is not None:
+            actor = device.get_actor_from_id(action.actor_id)
+        return ResolvedAction(action, device, actor, action.params)
+
+    def warm(self, devices):
+        self.devices = devices
+        generation = CacheGeneration.current(self.generation_name)
+        actions = dict((a.id, a) for a in Action.select())
+        tags = dict(Tag.select(Tag.id, Tag.action).tuples())
+        with self._lock:
+            self._actions = actions
+            self._tags = tags
+            self._generation = generation
+            self._checked = time.monotonic()
+
+    def expire(self):
+        """
+        Makes the next lookup check the generation.
+        """
+        with self._lock:
+            self._expired += 1
+            self._checked = None
+
+    def _check_generation(self):
+        """
+        Returns the current generation, after dropping the index if it
+        was filled at an older one.
+        """
+        checked, expired = self._checked, self._expired
+        now = time.monotonic()
+        if checked is not None and now - checked < self.check_interval:
+            return self._generation
+        generation = CacheGeneration.current(self.generation_name)
+        with self._lock:
+            if generation != self._generation:
+                self._actions = {}
+                self._tags = {}
+                self._generation = generation
+            # An expire() during the query may have been about a newer change.
+            if expired == self._expired:
+                self._checked = now
+        return generation
+
+    def _store_action(self, action, generation):
+        with self._lock:
+            # Rows read before a change elsewhere must not outlive it.
+            if generation == self._generation:
+                self._actions[action.id] = action
+        return self._resolve(action)
+
+    def _store_tag(self, tag_id, action_id, generation):
+        action_id = _action_key(action_id)
+        with self._lock:
+            if generation == self._generation:
+                self._tags[tag_id] = action_id
+        return action_id
+
+    def get_action(self, action_id):
+        generation = self._check_generation()
+        key = _action_key(action_id)
+        action = self._actions.get(key)
+        if action is not None:
+            return self._resolve(action)
+        action = Action.get_or_none(Action.id == key)
+        if action is None:
+            return None
+        return self._store_action(action, generation)
+
+    def get_tag_action_id(self, tag_id):
+        generation = self._check_generation()
+        action_id = self._tags.get(tag_id)
+        if action_id is not None:
+            return action_id
+        tag = Tag.get_or_none(Tag.id == tag_id)
+        if tag is None:
+            return None
+        return self._store_tag(tag.id, tag.action_id, generation)
+
+    def _bump(self):
+        """
+        Bumps the generation after a change made by this process. The
+        index is kept if no other change happened in the meantime, and
+        dropped otherwise. Returns the new generation.
+        """
+        previous = self._generation
+        CacheGeneration.bump(self.generation_name)
+        generation = CacheGeneration.current(self.generation_name)
+        with self._lock:
+            if previous is None or generation != previous + 1 \
+                    or self._generation != previous:
+                self._actions = {}
+                self._tags = {}
+            self._generation = generation
+            self._checked = time.monotonic()
+        invalidation.broadcast(self.generation_name)
+        return generation
+
+    def update_action(self, action):
+        return self._store_action(action, self._bump())
+
+    def update_actions(self, actions):
+        generation = self._bump()
+        for action in actions:
+            self._store_action(action, generation)
+
+    def remove_actions(self, id_list=None):
+        self._bump()
+        with self._lock:
+            if id_list is None:
+                self._actions.clear()
+            for action_id in id_list or ():
+                self._actions.pop(_action_key(action_id), None)
+
+    def update_tag(self, tag_id, action_id):
+        return self._store_tag(tag_id, action_id, self._bump())
+
+    def update_tags(self, tags):
+        generation = self._bump()
+        for tag_id, action_id in tags:
+            self._store_tag(tag_id, action_id, generation)
+
+    def remove_tags(self, id_list=None):
+        self._bump()
+        with self._lock:
+            if id_list is None:
+                self._tags.clear()
+            for tag_id in id_list or ():
+                self._tags.pop(tag_id, None)
+
+index = ActionIndex(const.action_index_check_interval)
+invalidation.register(ActionIndex.generation_name, lambda key: index.expire())
@@ -1,4 +1,10 @@
+import time
 from flask import Blueprint, request, jsonify, g, current_app
+from peewee import chunked
+from .. import metrics
+from ..actionindex import index
+from ..bulk import export_response, get_export_format, get_json, get_str, \
+                   import_rows, read_rows
 from ..db import Action
 from ..dbutil import get_db_object_list, model_to_dict
 from ..exceptions import InvalidUsage
@@ -41,6 +47,7 @@ def action_add():
                            device_id=device_id,
                            actor_id=actor_id,
                            params=params)
+    index.update_action(action)
 
     info("action created:", action.name, "(id is " + str(action.id) + ")")
     action_dict = model_to_dict(action)
@@ -54,7 +61,7 @@ def action_edit():
         raise InvalidUsage("id attribute is required")
 
     # Make sure that the tag exists.
-    action = Action.select().get_or_none(Action.id == action_id)
+    action = Action.get_or_none(Action.id == action_id)
     if action is None:
         raise InvalidUsage("action with the given id does not exist")
 
@@ -85,6 +92,7 @@ def action_edit():
         raise InvalidUsage("params attribute is required")
 
     action.save()
+    index.update_action(action)
     info("action changed:", action.name, "(id is " + str(action.id) + ")")
     action_dict = model_to_dict(action)
     return jsonify({'msg': 'Action saved', 'action': action_dict})
@@ -94,6 +102,69 @@ def action_edit():
 def action_list():
     return get_db_object_list(Action)
 
+@api.route('/action/import', methods=['POST'])
+@require_admin
+def action_import():
+    """
+    Creates actions from JSON or CSV rows (see bulk.read_rows()) with the
+    attributes of action/add; in CSV, params is a JSON string. Each
+    device/actor pair is looked up once per batch. Rows that are invalid,
+    reference unknown hardware or reuse an existing name are skipped and
+    reported.
+    """
+    rows = read_rows()
+    # Other values are reported by validate().
+    names = set(r.get("name") for r in rows if isinstance(r.get("name"), str))
+    seen = set()
+    for chunk in chunked(names, 500):
+        seen.update(a.name for a in Action.select(Action.name)
+                                          .where(Action.name.in_(chunk)))
+    actors = {}
+
+    def check_actor(device_id, actor_id):
+        key = device_id, actor_id
+        if key not in actors:
+            device = current_app.devices.get(device_id)
+            if device is None:
+                actors[key] = "unknown device_id " + device_id
+            elif device.get_actor_from_id(actor_id) is None:
+                actors[key] = "unknown actor_id " + actor_id
+            else:
+                actors[key] = None
+        if actors[key] is not None:
+            raise InvalidUsage(actors[key])
+
+    def validate(row):
+        name = get_str(row, "name")
+        if name in seen:
+            raise InvalidUsage("action with the given name exists already")
+        record = {'name': name,
+                  'description': get_str(row, "description", ''),
+                  'device_id': get_str(row, "device_id"),
+                  'actor_id': get_str(row, "actor_id"),
+                  'params': get_json(row, "params")}
+        check_actor(record['device_id'], record['actor_id'])
+        seen.add(name)
+        return record
+
+    records, errors = import_rows(Action, rows, validate)
+    if records:
+        imported = []
+        for chunk in chunked([r['name'] for r in records], 500):
+            imported.extend(Action.select().where(Action.name.in_(chunk)))
+        index.update_actions(imported)
+    info(len(records), 'actions imported,', len(errors), 'rows skipped')
+    return jsonify({'msg': 'Actions imported',
+                    'created': len(records),
+                    'errors': errors})
+
+@api.route('/action/export', methods=['POST'])
+@require_admin
+def action_export():
+    fmt = get_export_format()
+    info('actions exported as', fmt)
+    return export_response(Action, fmt, 'actions')
+
 @api.route('/action/remove', methods=['POST'])
 @require_admin
 def action_remove():
@@ -101,6 +172,7 @@ def action_remove():
     if id_list is None:
         raise InvalidUsage("id attribute is required")
     Action.delete().where(Action.id.in_(id_list)).execute()
+    index.remove_actions(id_list)
     info("actions removed:", '(' + ' '.join(id_list) + ')')
     return jsonify({'msg': 'Action removed', 'id': id_list})
 
@@ -108,36 +180,43 @@ def action_remove():
 @require_admin
 def action_remove_all():
     Action.delete().execute()
+    index.remove_actions()
     info("all actions removed")
     return jsonify({'msg': 'All actions removed'})
 
-"""
-Separate function to allow for other APIs to import it.
-"""
-def start_action_from_id(action_id):
-    action = Action.get_or_none(Action.id == action_id)
-    if action is None:
-        raise InvalidUsage("action with the given id does not exist")
-
-    device = current_app.devices.get(action.device_id)
-    if device is None:
+def _start_resolved_action(resolved):
+    action = resolved.action
+    if resolved.device is None:
         raise InvalidUsage("action references an unknown device" + str(action.device_id))
-    actor = device.get_actor_from_id(action.actor_id)
-    if actor is None:
+    if resolved.actor is None:
         raise InvalidUsage("action references an unknown actor:" + str(action.actor_id))
 
     debug("attempting to start action:", action.name)
+    start = time.perf_counter()
     try:
-        actor.trigger(device, action.params)
+        resolved.actor.trigger(resolved.device, resolved.params)
     except Exception as e:
         err('action "' + action.name + '"',
             "(id " + str(action.id) + ')',
             "failed:", e)
         raise
+    finally:
+        metrics.driver_trigger_duration.observe(time.perf_counter() - start,
+                                                resolved.device.id,
+                                                resolved.actor.id)
     info("action started:", action.name)
     action_dict = model_to_dict(action)
     return jsonify({'msg': 'Action started', 'action': action_dict})
 
+"""
+Separate function to allow for other APIs to import it.
+"""
+def start_action_from_id(action_id):
+    resolved = index.get_action(action_id)
+    if resolved is None:
+        raise InvalidUsage("action with the given id does not exist")
+    return _start_resolved_action(resolved)
+
 @api.route('/action/start', methods=['POST'])
 @require_auth
 def action_start():
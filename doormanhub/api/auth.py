@@ -1,18 +1,29 @@
 from flask import Blueprint, request, abort, jsonify, g
 from functools import wraps
 from datetime import datetime
-from .. import const
+from peewee import chunked
+from .. import appstate, const, invalidation, ratelimit, sessions
+from ..bulk import export_response, get_export_format, get_bool, get_str, \
+                   import_rows, read_rows
+from ..cache import TTLCache
 from ..db import Session, User
+from ..googleauth import verify_id_token, InvalidToken
 from ..util import hash_password
 from ..dbutil import get_db_object_list, model_to_dict
 from ..exceptions import InvalidUsage
 from ..logs import log, info, debug, err
 
-# Import external libraries.
-import apiclient
-from googleapiclient import errors
-from googleapiclient.discovery import build
-oauth = build('oauth2', 'v2', developerKey = const.google_api_key)
+# Maps session ids to the (authorized) user that owns them.
+session_cache = TTLCache(maxsize=const.session_cache_size,
+                         ttl=const.session_cache_ttl)
+
+def _drop_sessions(sid):
+    if sid is None:
+        session_cache.clear()
+    else:
+        session_cache.pop(sid)
+
+invalidation.register('sessions', _drop_sessions)
 
 def _getsid():
     sid = request.cookies.get("sid")
@@ -28,6 +39,13 @@ def attempt_auth():
     if sid is None:
         return
 
+    # Cached users are shared between threads; every request gets a copy
+    # of its own, so that changes to g.user do not leak into others.
+    user = session_cache.get(sid)
+    if user is not None:
+        g.user = User(**user.__data__)
+        return
+
     session = Session.get_or_none(Session.id == sid)
     if session is None or not session.is_valid():
         return
@@ -40,6 +58,15 @@ def attempt_auth():
         return
     g.user = user
 
+    # Never cache a session beyond its expiry date.
+    ttl = (session.expires - datetime.now()).total_seconds()
+    session_cache.set(sid, User(**user.__data__), ttl)
+
+def invalidate_user_sessions(predicate):
+    session_cache.remove_if(predicate)
+    # Predicates cannot be sent; other workers drop all their sessions.
+    invalidation.broadcast('sessions')
+
 def require_auth(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
@@ -57,6 +84,30 @@ def require_admin(func):
         return func(*args, **kwargs)
     return wrapper
 
+def _create_session(user):
+    """
+    Creates a new session for the given user, and ends the user's oldest
+    sessions if there are more than const.max_sessions_per_user.
+    """
+    expires = datetime.now() + const.session_timeout
+    session = Session.create(user=user, expires=expires)
+    for sid in sessions.evict_oldest(user):
+        invalidation.invalidate('sessions', sid)
+    return session
+
+def _check_rate_limit(*limits):
+    """
+    Takes a token from each of the given (limiter, key) pairs, and fails
+    with 429 if any of them is exhausted. Runs before any database work,
+    so that rejected attempts are cheap.
+    """
+    delay = max(ratelimit.acquire(limiter, key) for limiter, key in limits)
+    if delay:
+        retry_after = int(delay) + 1
+        raise InvalidUsage("too many login attempts", 429,
+                           {"retry_after": retry_after},
+                           {"Retry-After": str(retry_after)})
+
 api = Blueprint('Authentication API', __name__)
 
 @api.route('/session/start', methods=['POST'])
@@ -69,17 +120,21 @@ def session_start():
     if password is None:
         raise InvalidUsage("password attribute is required")
 
+    client_ip = request.remote_addr
+    try:
+        _check_rate_limit((ratelimit.login_ip, client_ip),
+                          (ratelimit.login_email, str(email).lower()))
+    except InvalidUsage:
+        ratelimit.failures.rejected(email, client_ip)
+        raise
+
     user = User.get_or_none(User.email == email)
     if user is None or not user.check_password(password):
-        err("login failed:", email)
+        if ratelimit.failures.failed(email, client_ip):
+            err("login failed:", email)
         abort(401)
 
-    expires = datetime.now() + const.session_timeout
-    session = Session.create(user=user, expires=expires)
-    if session is None:
-        err("Failed to create session:", email)
-        abort(500, "session creation failed")
-
+    session = _create_session(user)
     log(user, 'info', "User logged in (via password)")
     expires = session.expires.strftime(const.json_dateformat)
     return jsonify({"msg": "login successful",
@@ -93,12 +148,17 @@ def session_start_google():
     id_token = request.json.get("id_token")
     if id_token is None:
         raise InvalidUsage("id_token is required for google authentication")
+    if not const.google_client_id:
+        raise InvalidUsage("google authentication is not configured", 501)
+    _check_rate_limit((ratelimit.login_ip, request.remote_addr))
 
-    # Ask Google whether this token is valid.
-    google_request = oauth.tokeninfo(id_token=id_token, fields='email')
+    # Verify the token locally, using Google's (cached) signing keys.
     try:
-        result = google_request.execute()
-    except errors.HttpError as e:
+        result = verify_id_token(id_token)
+    except InvalidToken as e:
+        err("Google authentication failed:", e)
+        abort(401)
+    except Exception as e:
         abort(500, "google authentication error: " + str(e))
 
     # Check that the user id (=Google email address) is contained within the token.
@@ -112,11 +172,7 @@ def session_start_google():
         err("Google authentication for user", email, "failed")
         abort(401)
 
-    expires = datetime.now() + const.session_timeout
-    session = Session.create(user=user, expires=expires)
-    if session is None:
-        abort(500, "session creation failed")
-
+    session = _create_session(user)
     log(user, 'info', "user logged in (via Google)")
     expires = session.expires.strftime(const.json_dateformat)
     return jsonify({"msg": "login successful",
@@ -135,6 +191,7 @@ def session_check():
 @api.route('/session/end', methods=['POST'])
 def session_end():
     sid = _getsid()
+    invalidation.invalidate('sessions', sid)
     session = Session.get_or_none(Session.id == sid)
     if session is not None:
         session.delete_instance()
@@ -162,6 +219,7 @@ def define_admin():
                        full_name='Admin',
                        password=hash_password(password),
                        is_admin=True)
+    appstate.invalidate()
     log(user, 'info', 'initial admin account defined')
     return jsonify({'msg': 'Admin rights granted', 'email': user.email})
 
@@ -198,6 +256,7 @@ def user_add():
                        password=password,
                        is_admin=is_admin,
                        is_active=is_active)
+    appstate.invalidate()
     info('user created:', user.email)
     user_dict = model_to_dict(user)
     return jsonify({'msg': 'User created', 'user': user_dict})
@@ -229,6 +288,8 @@ def user_edit():
         user.set_password(password)
 
     user.save()
+    invalidate_user_sessions(lambda u: u.id == user.id)
+    appstate.invalidate()
     info('user changed:', user.email)
     user_dict = model_to_dict(user)
     return jsonify({'msg': 'User saved', 'user': user_dict})
@@ -238,6 +299,49 @@ def user_edit():
 def user_list():
     return get_db_object_list(User)
 
+@api.route('/user/import', methods=['POST'])
+@require_admin
+def user_import():
+    """
+    Creates users from JSON or CSV rows (see bulk.read_rows()) with the
+    attributes of user/add. password, full_name, is_admin and is_active
+    are optional. Rows that are invalid, or whose email address exists
+    already, are skipped and reported.
+    """
+    rows = read_rows()
+    # Other values are reported by validate().
+    emails = [r.get("email") for r in rows if isinstance(r.get("email"), str)]
+    seen = set()
+    for chunk in chunked(emails, 500):
+        seen.update(u.email for u in User.select(User.email)
+                                         .where(User.email.in_(chunk)))
+
+    def validate(row):
+        email = get_str(row, "email")
+        if email in seen:
+            raise InvalidUsage("user with the given email address exists already")
+        seen.add(email)
+        return {'email': email,
+                'full_name': get_str(row, "full_name", ''),
+                'password': hash_password(get_str(row, "password", '') or None),
+                'is_admin': get_bool(row, "is_admin", False),
+                'is_active': get_bool(row, "is_active", True)}
+
+    records, errors = import_rows(User, rows, validate)
+    appstate.invalidate()
+    info(len(records), 'users imported,', len(errors), 'rows skipped')
+    return jsonify({'msg': 'Users imported',
+                    'created': len(records),
+                    'errors': errors})
+
+@api.route('/user/export', methods=['POST'])
+@require_admin
+def user_export():
+    fmt = get_export_format()
+    info('users exported as', fmt)
+    return export_response(User, fmt, 'users',
+                           fields=['email', 'full_name', 'is_admin', 'is_active'])
+
 @api.route('/user/remove', methods=['POST'])
 @require_admin
 def user_remove():
@@ -245,6 +349,8 @@ def user_remove():
     if email is None:
         raise InvalidUsage("email attribute is required")
     User.delete().where(User.email == email).execute()
+    invalidate_user_sessions(lambda u: u.email == email)
+    appstate.invalidate()
     info('users deleted:', ', '.join(list(email)))
     return jsonify({'msg': 'User removed', 'email': email})
 
@@ -252,5 +358,7 @@ def user_remove():
 @require_admin
 def user_remove_all():
     User.delete().execute()
+    invalidation.invalidate('sessions')
+    appstate.invalidate()
     info('all users deleted')
     return jsonify({'msg': 'All users removed'})
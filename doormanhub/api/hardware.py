@@ -1,25 +1,71 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, current_app
+from .. import sse
 from ..exceptions import InvalidUsage
 from .auth import require_auth
 
 api = Blueprint('Hardware API', __name__)
 
-@api.route('/device/list', methods=['POST'])
+def _snapshot_response(key, build):
+    """
+    Returns the cached JSON snapshot of the device registry, or 304 Not
+    Modified if the client already has the current version (If-None-Match).
+    """
+    etag, data = current_app.devices.snapshot(key, build)
+    response = current_app.response_class(data, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+def _device_list(devices):
+    return {'msg': 'success',
+            'total': len(devices),
+            'list': [d.to_dict() for d in devices.values()]}
+
+@api.route('/device/list', methods=['GET', 'POST'])
 @require_auth
 def device_list():
-    return jsonify({'msg': 'success',
-                    'total': len(current_app.devices),
-                    'list': [d.to_dict() for d in current_app.devices.values()]})
+    devices = current_app.devices
+    return _snapshot_response('devices', lambda: _device_list(devices))
 
-@api.route('/actor/list', methods=['POST'])
+@api.route('/actor/list', methods=['GET', 'POST'])
 @require_auth
 def actor_list():
-    device_id = request.json.get("device_id")
+    params = request.get_json(silent=True) or request.args
+    device_id = params.get("device_id")
     if device_id is None:
         raise InvalidUsage("device_id attribute is required")
 
     device = current_app.devices.get(device_id)
     if device is None:
         raise InvalidUsage("unknown device id " + str(device_id))
-    return jsonify({'msg': 'success',
-                    'actors': [a.to_dict() for a in device.actors.values()]})
+    return _snapshot_response('actors-' + device_id, lambda: {
+        'msg': 'success',
+        'actors': [a.to_dict() for a in device.actors.values()]})
+
+@api.route('/state/stream', methods=['GET'])
+@require_auth
+def state_stream():
+    """
+    Streams the device list (as returned by device/list) as server-sent
+    events: once when the stream starts, and again whenever a device or
+    actor changes. The SSE id is the ETag of the device list, so a client
+    that reconnects with an up-to-date Last-Event-ID is not sent the
+    same list again.
+    """
+    devices = current_app.devices
+    last_etag = sse.last_event_id()
+    seen = devices.version
+
+    def poll():
+        nonlocal last_etag, seen
+        seen = devices.version
+        etag, data = devices.snapshot('devices', lambda: _device_list(devices))
+        if etag == last_etag:
+            return []
+        last_etag = etag
+        return [sse.message(data, 'devices', etag)]
+
+    def wait(timeout):
+        devices.wait(seen, timeout)
+
+    return sse.stream(wait, poll)
@@ -1,7 +1,43 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, Response, jsonify, current_app
+from .. import appstate, metrics, ratelimit
+from ..logs import writer
+from .auth import require_admin, session_cache
 
 api = Blueprint('Info API', __name__)
 
+metrics.CallbackCounter('doorman_session_cache_hits_total', 'Session cache hits.',
+                        lambda: session_cache.hits)
+metrics.CallbackCounter('doorman_session_cache_misses_total', 'Session cache misses.',
+                        lambda: session_cache.misses)
+metrics.Gauge('doorman_log_queue_length', 'Log records waiting to be written.',
+              lambda: writer.queue.qsize())
+metrics.CallbackCounter('doorman_log_records_written_total', 'Log records written.',
+                        lambda: writer.written)
+metrics.CallbackCounter('doorman_login_ip_rejected_total',
+                        'Logins rejected by the per IP limit.',
+                        lambda: ratelimit.login_ip.rejected)
+metrics.CallbackCounter('doorman_login_email_rejected_total',
+                        'Logins rejected by the per email limit.',
+                        lambda: ratelimit.login_email.rejected)
+
 @api.route('/hello', methods=['GET'])
 def session_start():
     return jsonify({"msg": "hello"})
+
+@api.route('/cache/stats', methods=['POST'])
+@require_admin
+def cache_stats():
+    return jsonify({"msg": "success",
+                    "session_cache": session_cache.stats(),
+                    "app_state_cache": appstate.cache.stats()})
+
+@api.route('/driver/list', methods=['POST'])
+@require_admin
+def driver_list():
+    return jsonify({"msg": "success",
+                    "drivers": current_app.driver_status})
+
+@api.route('/metrics', methods=['GET'])
+def metrics_export():
+    return Response(metrics.render(),
+                    content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,19 +1,156 @@
-from flask import Blueprint, jsonify
-from ..db import Event
-from ..dbutil import get_db_object_list
-from ..logs import info
+import json
+from flask import Blueprint, jsonify, request
+from peewee import fn
+from .. import const, eventstats, retention, sse
+from ..bulk import export_response, get_export_format
+from ..db import db, Event, EventStat
+from ..dbutil import get_db_object_list, get_datetime_param, get_list_param, \
+                     model_to_dict
+from ..exceptions import InvalidUsage
+from ..logs import info, events_written
 from .auth import require_admin
 
 api = Blueprint('Log API', __name__)
 
+def get_event_filters():
+    """
+    Returns the list of conditions defined by the optional "since",
+    "until", "severity", "user_id" and "client_ip" request attributes.
+    All of them are backed by (field, timestamp) indexes.
+    """
+    where = []
+    since = get_datetime_param("since")
+    if since is not None:
+        where.append(Event.timestamp >= since)
+    until = get_datetime_param("until")
+    if until is not None:
+        where.append(Event.timestamp < until)
+    for field in (Event.severity, Event.user_id, Event.client_ip):
+        values = get_list_param(field.name)
+        if values is not None:
+            where.append(field.in_(values))
+    return where
+
 @api.route('/event/list', methods=['POST'])
 @require_admin
 def event_list():
-    return get_db_object_list(Event)
+    return get_db_object_list(Event, get_event_filters())
+
+@api.route('/event/export', methods=['POST'])
+@require_admin
+def event_export():
+    """
+    Streams all events that match the filters of event/list, as NDJSON
+    (the default) or CSV, in constant memory.
+    """
+    fmt = get_export_format()
+    info('events exported as', fmt)
+    return export_response(Event, fmt, 'events', get_event_filters())
+
+@api.route('/event/stats', methods=['POST'])
+@require_admin
+def event_stats():
+    """
+    Returns the number of events per "interval" ("hour", the default, or
+    "day"), optionally split by the fields in "group_by" ("severity" and/or
+    "user_id"). Accepts the "since", "until", "severity" and "user_id"
+    filters of event/list, at the resolution of one hour: "since" and
+    "until" are rounded down to the full hour. Answered from the EventStat
+    rollup, not from the Event table.
+    """
+    interval = request.json.get("interval", "hour")
+    if interval not in eventstats.INTERVALS:
+        raise InvalidUsage("interval must be one of: " + ", ".join(eventstats.INTERVALS))
+    group_by = get_list_param("group_by") or []
+    for field in group_by:
+        if field not in eventstats.GROUP_FIELDS:
+            raise InvalidUsage("cannot group by " + str(field))
+
+    where = []
+    since = get_datetime_param("since")
+    if since is not None:
+        where.append(EventStat.bucket >= eventstats.get_bucket(since))
+    until = get_datetime_param("until")
+    if until is not None:
+        where.append(EventStat.bucket < eventstats.get_bucket(until))
+    for field in (EventStat.severity, EventStat.user_id):
+        values = get_list_param(field.name)
+        if values is not None:
+            where.append(field.in_(values))
+
+    stats = eventstats.query(interval, group_by, where)
+    for stat in stats:
+        stat['bucket'] = stat['bucket'].strftime(const.json_dateformat)
+    return jsonify({'msg': 'success',
+                    'interval': interval,
+                    'stats': stats})
+
+@api.route('/event/stats/rebuild', methods=['POST'])
+@require_admin
+def event_stats_rebuild():
+    """
+    Recomputes the rollup that event/stats uses from all events.
+    """
+    count = eventstats.rebuild()
+    info('event statistics rebuilt from', count, 'events')
+    return jsonify({'msg': 'Event statistics rebuilt', 'events': count})
+
+@api.route('/event/stream', methods=['GET'])
+@require_admin
+def event_stream():
+    """
+    Streams new events as server-sent events, using the event id as the
+    SSE id. A client that reconnects with Last-Event-ID (or passes
+    "last_id") receives all events it missed; otherwise, the stream
+    starts with the next event that is written.
+    """
+    last_id = sse.last_event_id()
+    if last_id is None:
+        # No ORDER BY: Postgres rejects it next to an aggregate.
+        last_id = Event.select(fn.MAX(Event.id)).order_by().scalar() or 0
+    try:
+        last_id = int(last_id)
+    except ValueError:
+        raise InvalidUsage('invalid last event id: ' + str(last_id))
+    seen = events_written.version
+
+    def poll():
+        nonlocal last_id, seen
+        seen = events_written.version
+        # The request's connection was returned to the pool when the
+        # response started, so every poll takes one just for the query.
+        with db.connection_context():
+            events = list(Event.select()
+                               .where(Event.id > last_id)
+                               .order_by(Event.id)
+                               .limit(const.stream_batch_size))
+        if events:
+            last_id = events[-1].id
+        return [sse.message(json.dumps(model_to_dict(e)), 'event', e.id)
+                for e in events]
+
+    def wait(timeout):
+        # Events logged by other processes are not notified here.
+        events_written.wait(seen, min(timeout, const.stream_poll_interval))
+
+    return sse.stream(wait, poll)
 
 @api.route('/event/remove_all', methods=['POST'])
 @require_admin
 def event_remove_all():
-    Event.delete().execute()
+    with db.atomic():
+        Event.delete().execute()
+        EventStat.delete().execute()
     info('all logs cleared')
     return jsonify({'msg': 'All events removed'})
+
+@api.route('/event/purge', methods=['POST'])
+@require_admin
+def event_purge():
+    if not retention.policy:
+        raise InvalidUsage("no event retention policy is configured")
+    retention.task.start()
+    retention.task.trigger()
+    return jsonify({'msg': 'Event purge started',
+                    'policy': dict((k, v.days)
+                                   for k, v in retention.policy.items())})
@@ -1,5 +1,9 @@
 from flask import Blueprint, request, abort, jsonify, g
-from ..db import Tag
+from peewee import chunked
+from ..actionindex import index
+from ..bulk import export_response, get_export_format, get_str, \
+                   import_rows, read_rows
+from ..db import Action, Tag
 from ..exceptions import InvalidUsage
 from ..dbutil import get_db_object_list, model_to_dict
 from ..logs import info
@@ -25,6 +29,7 @@ def tag_add():
         raise InvalidUsage("tag with the given id exists already")
 
     tag = Tag.create(id=theid, action_id=action_id)
+    index.update_tag(tag.id, tag.action_id)
     info('New NFC tag with ID', theid, "created")
     tag_dict = model_to_dict(tag)
     return jsonify({'msg': 'Tag created', 'tag': tag_dict})
@@ -45,7 +50,8 @@ def tag_edit():
     if tag.action_id is None:
         raise InvalidUsage("action_id attribute is required")
 
-    tag.save(g.db)
+    tag.save()
+    index.update_tag(tag.id, tag.action_id)
     info("NFC tag with ID", tag_id, "assigned to action", tag.action_id)
     tag_dict = model_to_dict(tag)
     return jsonify({'msg': 'Tag saved', 'tag': tag_dict})
@@ -55,6 +61,67 @@ def tag_edit():
 def tag_list():
     return get_db_object_list(Tag)
 
+@api.route('/tag/import', methods=['POST'])
+@require_admin
+def tag_import():
+    """
+    Creates tags from JSON or CSV rows (see bulk.read_rows()) with an "id"
+    and an "action_name" or an "action_id". The name is preferred, so that
+    the export of one hub can be imported into a hub whose action ids
+    differ. Rows that are invalid, reference unknown actions or reuse an
+    existing tag id are skipped and reported.
+    """
+    rows = read_rows()
+    tag_ids = set(str(r["id"]) for r in rows if r.get("id"))
+    seen = set()
+    for chunk in chunked(tag_ids, 500):
+        seen.update(t.id for t in Tag.select(Tag.id).where(Tag.id.in_(chunk)))
+    # Maps action ids (as strings) and names to action ids.
+    action_ids = {}
+    for action_id, name in Action.select(Action.id, Action.name).tuples():
+        action_ids[str(action_id)] = action_ids['name:' + name] = action_id
+
+    def validate(row):
+        tag_id = get_str(row, "id")
+        if tag_id in seen:
+            raise InvalidUsage("tag with the given id exists already")
+        if row.get("action_name") not in (None, ''):
+            action_id = action_ids.get('name:' + get_str(row, "action_name"))
+        else:
+            action_id = action_ids.get(get_str(row, "action_id"))
+        if action_id is None:
+            raise InvalidUsage("unknown action")
+        seen.add(tag_id)
+        return {'id': tag_id, 'action': action_id}
+
+    records, errors = import_rows(Tag, rows, validate)
+    if records:
+        index.update_tags((r['id'], r['action']) for r in records)
+    info(len(records), 'NFC tags imported,', len(errors), 'rows skipped')
+    return jsonify({'msg': 'Tags imported',
+                    'created': len(records),
+                    'errors': errors})
+
+@api.route('/tag/export', methods=['POST'])
+@require_admin
+def tag_export():
+    """
+    Exports the tags with the id and the name of their action, so that
+    tag/import can resolve them on a hub whose action ids differ.
+    """
+    fmt = get_export_format()
+    action_names = dict(Action.select(Action.id, Action.name).tuples())
+
+    def tag_to_dict(tag):
+        return {'id': tag.id,
+                'action_id': tag.action_id,
+                'action_name': action_names.get(tag.action_id)}
+
+    info('NFC tags exported as', fmt)
+    return export_response(Tag, fmt, 'tags',
+                           fields=['id', 'action_id', 'action_name'],
+                           to_dict=tag_to_dict)
+
 @api.route('/tag/remove', methods=['POST'])
 @require_admin
 def tag_remove():
@@ -62,6 +129,7 @@ def tag_remove():
     if id_list is None:
         raise InvalidUsage("id attribute is required")
     Tag.delete().where(Tag.id.in_(id_list)).execute()
+    index.remove_tags(id_list)
     info("NFC tags removed:", ' '.join(id_list))
     return jsonify({'msg': 'Tag removed', 'id': id_list})
 
@@ -69,18 +137,19 @@ def tag_remove():
 @require_admin
 def tag_remove_all():
     Tag.delete().execute()
+    index.remove_tags()
     info("All NFC tags removed")
     return jsonify({'msg': 'All tags removed'})
 
 @api.route('/tag/start', methods=['POST'])
 @require_admin
-def tag_start(self):
+def tag_start():
     tag_id = request.json.get("id")
     if tag_id is None:
         raise InvalidUsage("id attribute is required")
 
-    tag = Tag.get_or_none(Tag.id == tag_id)
-    if tag:
+    action_id = index.get_tag_action_id(tag_id)
+    if action_id is None:
         raise InvalidUsage("tag with the given id does not exist")
-    info("Starting action", tag.action_id, "from NFC tag", tag_id)
-    return start_action_from_id(tag.action_id)
+    info("Starting action", action_id, "from NFC tag", tag_id)
+    return start_action_from_id(action_id)
@@ -0,0 +1,40 @@
+from flask import render_template
+from . import const, invalidation
+from .cache import TTLCache
+from .db import User
+from .util import getserial
+
+# Values that are expensive to look up but hardly ever change, and pages
+# rendered from them. invalidate() drops everything, in all web workers
+# if a hardware daemon relays it (see invalidation.py); otherwise, other
+# processes pick up the change when their entries expire.
+cache = TTLCache(maxsize=const.app_state_cache_size, ttl=const.app_state_ttl)
+invalidation.register('appstate', lambda key: cache.clear())
+
+_missing = object()
+
+def _cached(key, func):
+    value = cache.get(key, _missing)
+    if value is _missing:
+        value = func()
+        cache.set(key, value)
+    return value
+
+def admin_exists():
+    return _cached('admin_exists', lambda: User.select().where(
+        User.is_active == True, User.is_admin == True).exists())
+
+def serial():
+    return _cached('serial', getserial)
+
+def render_page(template, **context):
+    """
+    Like render_template(), but caches the result. Only for pages that
+    depend on nothing but the given context, and not on the user or the
+    request.
+    """
+    key = ('page', template) + tuple(sorted(context.items()))
+    return _cached(key, lambda: render_template(template, **context))
+
+def invalidate():
+    invalidation.invalidate('appstate')
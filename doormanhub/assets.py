@@ -0,0 +1,149 @@
+"""
+Fingerprinted, precompressed static files.
+
+The build step copies every file in doormanhub/static to the build
+directory under a name that contains a hash of its content (hub.js
+becomes hub.3f2a9c0d1b7e.js), writes gzip and brotli compressed copies
+of text files next to it, and records the names in manifest.json:
+
+    DOORMAN_ROLE=build python -m doormanhub.assets
+
+Templates refer to the files through asset_url('hub.js'). Hashed files
+never change, so they are served with immutable cache headers; if no
+build exists, asset_url() falls back to the plain files in static/.
+"""
+import io
+import os
+import sys
+import gzip
+import json
+import shutil
+import hashlib
+import argparse
+import mimetypes
+from flask import request, send_file, send_from_directory
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MANIFEST = 'manifest.json'
+COMPRESSIBLE = ('.css', '.html', '.js', '.json', '.svg', '.txt')
+MIN_COMPRESS_SIZE = 256
+# Preferred first.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+def _hash(data):
+    return hashlib.sha256(data).hexdigest()[:12]
+
+def _compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    # A fixed mtime makes builds reproducible.
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=9, mtime=0) as fp:
+        fp.write(data)
+    return buf.getvalue()
+
+def build(static_dir, build_dir):
+    """
+    Writes the hashed and compressed files and the manifest to build_dir,
+    removing the output of previous builds. Returns the manifest, which
+    maps original names to hashed names.
+    """
+    if os.path.isdir(build_dir):
+        shutil.rmtree(build_dir)
+    os.makedirs(build_dir)
+    encodings = [(n, s) for n, s in ENCODINGS if n != 'br' or brotli is not None]
+
+    files = {}
+    for root, dirs, filenames in os.walk(static_dir):
+        dirs.sort()
+        for filename in sorted(filenames):
+            path = os.path.join(root, filename)
+            name = os.path.relpath(path, static_dir).replace(os.sep, '/')
+            base, ext = os.path.splitext(name)
+            with open(path, 'rb') as fp:
+                data = fp.read()
+            hashed = '{}.{}{}'.format(base, _hash(data), ext)
+            files[name] = {'file': hashed, 'encodings': []}
+
+            target = os.path.join(build_dir, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as fp:
+                fp.write(data)
+            if ext.lower() not in COMPRESSIBLE or len(data) < MIN_COMPRESS_SIZE:
+                continue
+            for encoding, suffix in encodings:
+                compressed = _compress(data, encoding)
+                if len(compressed) >= len(data):
+                    continue
+                with open(target + suffix, 'wb') as fp:
+                    fp.write(compressed)
+                files[name]['encodings'].append(encoding)
+
+    with open(os.path.join(build_dir, MANIFEST), 'w') as fp:
+        json.dump(files, fp, indent=2, sort_keys=True)
+    return files
+
+class Assets(object):
+    """
+    Resolves and serves the files of a build (see build()). Files that
+    are not part of the build are served from static_dir as before.
+    """
+    def __init__(self, static_dir, build_dir, url_prefix):
+        self.static_dir = static_dir
+        self.build_dir = build_dir
+        self.url_prefix = url_prefix
+        self.files = {}
+        self.hashed = {}  # hashed name -> supported encodings
+        self.load()
+
+    def load(self):
+        path = os.path.join(self.build_dir, MANIFEST)
+        try:
+            with open(path) as fp:
+                self.files = json.load(fp)
+        except FileNotFoundError:
+            self.files = {}
+        self.hashed = dict((f['file'], f['encodings']) for f in self.files.values())
+
+    def url(self, name):
+        entry = self.files.get(name)
+        return self.url_prefix + '/' + (entry['file'] if entry else name)
+
+    def send(self, path):
+        encodings = self.hashed.get(path)
+        if encodings is None:
+            return send_from_directory(self.static_dir, path)
+
+        filename = os.path.join(self.build_dir, path)
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        for encoding, suffix in ENCODINGS:
+            if encoding in encodings and request.accept_encodings[encoding]:
+                response = send_file(filename + suffix, mimetype=mimetype)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_file(filename, mimetype=mimetype)
+        if encodings:
+            response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = IMMUTABLE
+        return response
+
+def main():
+    parser = argparse.ArgumentParser(description='Builds the static files.')
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser.add_argument('--static-dir', default=os.path.join(here, 'static'))
+    parser.add_argument('--build-dir', default=os.environ.get('ASSET_DIR',
+                                                   os.path.join(here, 'build')))
+    args = parser.parse_args()
+    if brotli is None:
+        print('brotli is not installed; writing gzip files only', file=sys.stderr)
+    files = build(args.static_dir, args.build_dir)
+    print('{} files written to {}'.format(len(files), args.build_dir))
+
+if __name__ == '__main__':
+    main()
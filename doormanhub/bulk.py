@@ -0,0 +1,144 @@
+"""
+Bulk import and export of model rows, as JSON or CSV.
+"""
+import io
+import csv
+import json
+from flask import Response, request, stream_with_context
+from peewee import chunked, IntegrityError
+from .db import db
+from .dbutil import iter_db_objects, model_to_dict
+from .exceptions import InvalidUsage
+
+def read_rows():
+    """
+    Returns the rows posted to a bulk import endpoint as a list of dicts.
+    The body is either CSV with a header line (Content-Type text/csv),
+    or JSON with a "rows" list of objects, or JSON with a "csv" string.
+    """
+    if request.mimetype == 'text/csv':
+        text = request.get_data(as_text=True)
+    else:
+        body = request.get_json(silent=True) or {}
+        rows = body.get("rows")
+        if rows is not None:
+            if not isinstance(rows, list) \
+               or not all(isinstance(r, dict) for r in rows):
+                raise InvalidUsage("rows must be a list of objects")
+            return rows
+        text = body.get("csv")
+        if text is None:
+            raise InvalidUsage("rows or csv attribute is required")
+    return list(csv.DictReader(io.StringIO(text)))
+
+def get_str(row, name, default=None):
+    value = row.get(name)
+    if value is None or value == '':
+        if default is None:
+            raise InvalidUsage(name + " attribute is required")
+        return default
+    if isinstance(value, (dict, list)):
+        raise InvalidUsage(name + " must be a string")
+    return str(value)
+
+def get_bool(row, name, default):
+    value = row.get(name)
+    if value is None or value == '':
+        return default
+    if isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in ('1', 'true', 'yes'):
+        return True
+    if value in ('0', 'false', 'no'):
+        return False
+    raise InvalidUsage(name + " must be a boolean: " + value)
+
+def get_json(row, name):
+    """
+    Returns the given attribute; strings (as found in CSV) are decoded
+    as JSON.
+    """
+    value = row.get(name)
+    if value is None or value == '':
+        raise InvalidUsage(name + " attribute is required")
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError as e:
+            raise InvalidUsage(name + " is not valid JSON: " + str(e))
+    return value
+
+def import_rows(cls, rows, validate, chunk_size=100):
+    """
+    Calls validate(row) for each row; it returns the record to insert or
+    raises InvalidUsage. All valid records are then inserted using
+    insert_many, in one transaction. Invalid rows are skipped and reported
+    as {"row": <number>, "msg": <error>}, numbered from 1 (not counting
+    the header line of CSV).
+
+    Returns the inserted records and the list of errors.
+    """
+    records = []
+    errors = []
+    for number, row in enumerate(rows, start=1):
+        try:
+            records.append(validate(row))
+        except InvalidUsage as e:
+            errors.append({'row': number, 'msg': e.message})
+
+    try:
+        with db.atomic():
+            for chunk in chunked(records, chunk_size):
+                cls.insert_many(chunk).execute()
+    except IntegrityError as e:
+        raise InvalidUsage("import failed, nothing was written: " + str(e), 409)
+    return records, errors
+
+def _export_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+def _export_ndjson(objects, fields, to_dict):
+    for obj in objects:
+        thedict = to_dict(obj)
+        yield json.dumps(dict((f, thedict[f]) for f in fields)) + '\n'
+
+def _export_csv(objects, fields, to_dict):
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fields)
+    writer.writeheader()
+    for obj in objects:
+        thedict = to_dict(obj)
+        writer.writerow(dict((f, _export_value(thedict[f])) for f in fields))
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+export_formats = {'ndjson': (_export_ndjson, 'application/x-ndjson'),
+                  'csv': (_export_csv, 'text/csv')}
+
+def get_export_format():
+    fmt = (request.get_json(silent=True) or request.args).get("format", "ndjson")
+    if fmt not in export_formats:
+        raise InvalidUsage("format must be one of " + ', '.join(export_formats))
+    return fmt
+
+def export_response(cls, fmt, name, where=None, fields=None, to_dict=model_to_dict):
+    """
+    Returns a response that streams the given fields of all matching rows
+    as NDJSON or CSV, in constant memory. The CSV output of the user, tag
+    and action exports can be imported again.
+    """
+    if fields is None:
+        fields = cls._meta.sorted_field_names
+    generate, mimetype = export_formats[fmt]
+    objects = iter_db_objects(cls, where)
+    response = Response(stream_with_context(generate(objects, fields, to_dict)),
+                        mimetype=mimetype)
+    response.headers['Content-Disposition'] = \
+        'attachment; filename=' + name + '.' + fmt
+    return response
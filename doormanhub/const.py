@@ -4,7 +4,15 @@ from datetime import timedelta
 __dirname__ = os.path.dirname(__file__)
 crypto_salt = os.environ['CRYPTO_SALT']
 
-google_api_key = os.environ['GOOGLE_API_KEY']
+# Google ID tokens are verified locally, using the signing certificates
+# published at GOOGLE_CERTS_URL, and must have been issued for the OAuth
+# client GOOGLE_CLIENT_ID; Google login is disabled if it is not set.
+# Tokens signed by an unknown key refetch the certificates at most once
+# per GOOGLE_CERTS_MIN_REFRESH seconds.
+google_client_id = os.environ.get('GOOGLE_CLIENT_ID')
+google_certs_url = os.environ.get('GOOGLE_CERTS_URL',
+                                  'https://www.googleapis.com/oauth2/v1/certs')
+google_certs_min_refresh = int(os.environ.get('GOOGLE_CERTS_MIN_REFRESH', 60))
 
 support_email = os.environ['SUPPORT_EMAIL']
 smtp_server = os.environ['SMTP_SERVER_AND_PORT']
@@ -13,9 +21,75 @@ smtp_from = support_email
 smtp_password = os.environ['SMTP_PASSWORD']
 
 session_timeout = timedelta(days=180)
+
+# Expired sessions are deleted in the background, in batches; see
+# sessions.sweep(). Users with more than MAX_SESSIONS_PER_USER sessions
+# lose their oldest ones on login (0 means no limit).
+session_sweep_interval = int(os.environ.get('SESSION_SWEEP_INTERVAL', 3600))
+session_sweep_batch_size = int(os.environ.get('SESSION_SWEEP_BATCH_SIZE', 500))
+session_sweep_pause = int(os.environ.get('SESSION_SWEEP_PAUSE_MS', 50)) / 1000.0
+max_sessions_per_user = int(os.environ.get('MAX_SESSIONS_PER_USER', 20))
+
+# Login attempts are rate limited per client IP and per email address,
+# using token buckets that hold up to *_BURST attempts and refill at
+# *_PER_MINUTE attempts per minute. Failed logins are reported as one
+# summarized event per LOGIN_FAILURE_REPORT_INTERVAL seconds. Each limiter
+# and the failure report track at most LOGIN_LIMITER_SIZE keys.
+login_ip_burst = int(os.environ.get('LOGIN_IP_BURST', 20))
+login_ip_per_minute = float(os.environ.get('LOGIN_IP_PER_MINUTE', 10))
+login_email_burst = int(os.environ.get('LOGIN_EMAIL_BURST', 5))
+login_email_per_minute = float(os.environ.get('LOGIN_EMAIL_PER_MINUTE', 2))
+login_limiter_size = int(os.environ.get('LOGIN_LIMITER_SIZE', 10000))
+login_failure_report_interval = int(os.environ.get('LOGIN_FAILURE_REPORT_INTERVAL', 60))
+
+# Validated sessions are cached in memory to avoid hitting the DB
+# on every request; see api.auth.attempt_auth().
+session_cache_size = int(os.environ.get('SESSION_CACHE_SIZE', 1024))
+session_cache_ttl = int(os.environ.get('SESSION_CACHE_TTL', 60))
+
+# Rarely changing values (such as whether an admin exists) and the pages
+# rendered from them are cached for APP_STATE_TTL seconds; see appstate.py.
+app_state_cache_size = int(os.environ.get('APP_STATE_CACHE_SIZE', 64))
+app_state_ttl = int(os.environ.get('APP_STATE_TTL', 30))
+
+# Actions and NFC tags are indexed in memory; changes made by other
+# processes are noticed within ACTION_INDEX_CHECK_INTERVAL seconds, or
+# right away with a hardware daemon. See actionindex.py.
+action_index_check_interval = float(os.environ.get('ACTION_INDEX_CHECK_INTERVAL', 1))
+
+# Events are queued and written to the database in batches by a
+# background thread; see logs.EventWriter.
+log_async = os.environ.get('LOG_ASYNC', '1') != '0'
+log_batch_size = int(os.environ.get('LOG_BATCH_SIZE', 100))
+log_flush_interval = int(os.environ.get('LOG_FLUSH_INTERVAL_MS', 250)) / 1000.0
+log_queue_size = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+log_queue_timeout = int(os.environ.get('LOG_QUEUE_TIMEOUT_MS', 100)) / 1000.0
+
+# Events older than the given number of days are deleted in the background,
+# per severity, e.g. "debug=7,info=365,error=0". 0 (or leaving a severity
+# out) keeps events forever; by default, nothing is ever deleted.
+# If EVENT_ARCHIVE_DIR is set, expired events are first appended to
+# gzipped, per-day NDJSON files in that directory.
+event_retention = os.environ.get('EVENT_RETENTION', '')
+event_retention_interval = int(os.environ.get('EVENT_RETENTION_INTERVAL', 3600))
+event_retention_batch_size = int(os.environ.get('EVENT_RETENTION_BATCH_SIZE', 500))
+event_retention_pause = int(os.environ.get('EVENT_RETENTION_PAUSE_MS', 50)) / 1000.0
+event_archive_dir = os.environ.get('EVENT_ARCHIVE_DIR')
+
 json_dateformat = '%Y-%m-%d %H:%M:%S'
-db_file = os.path.join(__dirname__, 'hub.db')
+
+# How long an exact row count may be reused as an estimated total in
+# list responses; see dbutil.estimate_count().
+count_cache_ttl = int(os.environ.get('COUNT_CACHE_TTL', 30))
+# Drivers are initialized concurrently at startup; drivers that take
+# longer than this (in seconds) are marked degraded.
+driver_init_timeout = float(os.environ.get('DRIVER_INIT_TIMEOUT', 30))
+
+# May also be a URI, e.g. "file:hub?mode=memory&cache=shared".
+db_file = os.environ.get('DB_FILE', os.path.join(__dirname__, 'hub.db'))
 static_dir = os.path.join(__dirname__, 'static')
+# Output of the static file build; see assets.py.
+asset_dir = os.environ.get('ASSET_DIR', os.path.join(__dirname__, 'build'))
 
 # If DB_HOST is not defined, sqlite will be used.
 db_host = os.environ.get('DB_HOST')
@@ -23,3 +97,46 @@ db_port = os.environ.get('DB_PORT')
 db_db = os.environ.get('DB_DB')
 db_user = os.environ.get('DB_USER')
 db_password = os.environ.get('DB_PASSWORD')
+
+# Connection pool settings. Connections that were idle for longer than
+# DB_CHECK_IDLE seconds are pinged before being reused (Postgres only).
+db_max_connections = int(os.environ.get('DB_MAX_CONNECTIONS', 16))
+db_stale_timeout = int(os.environ.get('DB_STALE_TIMEOUT', 300))
+db_pool_timeout = int(os.environ.get('DB_POOL_TIMEOUT', 10))
+db_check_idle = int(os.environ.get('DB_CHECK_IDLE', 30))
+
+# Sqlite tuning; WAL lets readers proceed while the log writer is busy.
+sqlite_journal_mode = os.environ.get('SQLITE_JOURNAL_MODE', 'wal')
+sqlite_synchronous = os.environ.get('SQLITE_SYNCHRONOUS', 'normal')
+sqlite_busy_timeout = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+sqlite_mmap_size = int(os.environ.get('SQLITE_MMAP_SIZE', 64 * 1024 * 1024))
+
+# Server-sent event streams (api.log.event_stream, api.hardware.state_stream)
+# send a comment every STREAM_KEEPALIVE seconds to keep proxies from closing
+# idle connections. Events written by other processes are picked up after
+# at most STREAM_POLL_INTERVAL seconds.
+stream_keepalive = float(os.environ.get('STREAM_KEEPALIVE', 15))
+stream_poll_interval = float(os.environ.get('STREAM_POLL_INTERVAL', 2))
+stream_batch_size = int(os.environ.get('STREAM_BATCH_SIZE', 100))
+# Every open stream occupies one of the WEB_THREADS threads of a gthread
+# worker, so at most STREAM_MAX_CLIENTS streams (by default a quarter of
+# the threads; none with a sync worker) are served per process. Streams
+# end after STREAM_MAX_DURATION seconds; clients reconnect and resume.
+stream_max_clients = int(os.environ.get('STREAM_MAX_CLIENTS',
+                                        int(os.environ.get('WEB_THREADS', 8)) // 4))
+stream_max_duration = float(os.environ.get('STREAM_MAX_DURATION', 300))
+
+# Drivers read back the state of their hardware every HARDWARE_POLL_INTERVAL
+# seconds, to notice changes made outside of the hub; 0 disables polling.
+hardware_poll_interval = float(os.environ.get('HARDWARE_POLL_INTERVAL', 5))
+
+# If HWD_SOCKET is set, the hub does not load any drivers itself; instead,
+# it talks to the hardware daemon (python -m doormanhub.hwd) listening on
+# this unix socket. This allows for running any number of web workers.
+# Workers wait up to HWD_WAIT seconds for a change of the device list
+# per request to the daemon, and retry every HWD_RETRY_INTERVAL seconds
+# while it is unreachable.
+hwd_socket = os.environ.get('HWD_SOCKET')
+hwd_timeout = float(os.environ.get('HWD_TIMEOUT', 10))
+hwd_wait = float(os.environ.get('HWD_WAIT', 30))
+hwd_retry_interval = float(os.environ.get('HWD_RETRY_INTERVAL', 5))
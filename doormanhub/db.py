@@ -1,19 +1,83 @@
 import json
+import time
 from peewee import *
+from playhouse.pool import PooledPostgresqlDatabase, PooledSqliteDatabase
 from datetime import datetime
-from . import const
+from . import const, metrics
 from .util import rand_string, hash_password
 
+class QueryMetricsMixin(object):
+    def execute_sql(self, sql, params=None, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super(QueryMetricsMixin, self).execute_sql(sql, params, *args, **kwargs)
+        finally:
+            metrics.record_query(time.perf_counter() - start)
+
+class HealthCheckedPooledPostgresqlDatabase(QueryMetricsMixin, PooledPostgresqlDatabase):
+    """
+    Pings pooled connections that were idle for longer than check_idle
+    seconds before handing them out again, so that connections dropped
+    by the server (e.g. after a restart) are replaced transparently.
+    """
+    def __init__(self, database, check_idle=30, **kwargs):
+        self._check_idle = check_idle
+        self._returned = {}
+        super(HealthCheckedPooledPostgresqlDatabase, self).__init__(database, **kwargs)
+
+    def _is_closed(self, conn):
+        if super(HealthCheckedPooledPostgresqlDatabase, self)._is_closed(conn):
+            return True
+        returned = self._returned.pop(self.conn_key(conn), None)
+        if returned is None or time.time() - returned < self._check_idle:
+            return False
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except Exception:
+            return True
+        finally:
+            # The ping opened a transaction, which must not be handed out.
+            try:
+                conn.rollback()
+            except Exception:
+                return True
+        return False
+
+    def _close(self, conn, close_conn=False):
+        if close_conn:
+            self._returned.pop(self.conn_key(conn), None)
+        else:
+            self._returned[self.conn_key(conn)] = time.time()
+        super(HealthCheckedPooledPostgresqlDatabase, self)._close(conn, close_conn)
+
+class MeteredPooledSqliteDatabase(QueryMetricsMixin, PooledSqliteDatabase):
+    pass
+
 # Connect to the database. Gracefully fall back to Sqlite to
 # make things easier to test.
+# Connections are pooled; hub.teardown_request returns them to the pool.
 if const.db_host:
-    db = PostgresqlDatabase(const.db_db,
-                            host=const.db_host,
-                            port=const.db_port,
-                            user=const.db_user,
-                            password=const.db_password)
+    db = HealthCheckedPooledPostgresqlDatabase(const.db_db,
+                                               host=const.db_host,
+                                               port=const.db_port,
+                                               user=const.db_user,
+                                               password=const.db_password,
+                                               max_connections=const.db_max_connections,
+                                               stale_timeout=const.db_stale_timeout,
+                                               timeout=const.db_pool_timeout,
+                                               check_idle=const.db_check_idle)
 else:
-    db = SqliteDatabase(const.db_file)
+    db = MeteredPooledSqliteDatabase(const.db_file,
+                                     max_connections=const.db_max_connections,
+                                     stale_timeout=const.db_stale_timeout,
+                                     timeout=const.db_pool_timeout,
+                                     check_same_thread=False,
+                                     uri=True,
+                                     pragmas={'journal_mode': const.sqlite_journal_mode,
+                                              'synchronous': const.sqlite_synchronous,
+                                              'busy_timeout': const.sqlite_busy_timeout,
+                                              'mmap_size': const.sqlite_mmap_size})
 
 class JSONField(TextField):
     def db_value(self, value):
@@ -23,6 +87,20 @@ class JSONField(TextField):
         if value is not None:
             return json.loads(value)
 
+# Not available before Python 3.7.
+_fromisoformat = getattr(datetime, 'fromisoformat', None)
+
+class FastDateTimeField(DateTimeField):
+    # Sqlite returns datetimes as ISO strings; fromisoformat() parses
+    # them many times faster than the strptime() based default.
+    def python_value(self, value):
+        if isinstance(value, str) and _fromisoformat is not None:
+            try:
+                return _fromisoformat(value)
+            except ValueError:
+                pass
+        return super(FastDateTimeField, self).python_value(value)
+
 class OrderedModel(Model):
     class Meta:
         order_by = []
@@ -68,11 +146,15 @@ class User(OrderedModel):
 class Session(Model):
     id = CharField(max_length=21, primary_key=True, default=rand_string, index=True)
     user = ForeignKeyField(User, backref='sessions')
-    expires = DateTimeField()
-    created = DateTimeField(default=datetime.now)
+    expires = FastDateTimeField()
+    created = FastDateTimeField(default=datetime.now)
 
     class Meta:
         database = db
+        indexes = (
+            (('expires',), False),
+            (('user', 'created'), False),
+        )
 
     def is_valid(self):
         return self.expires >= datetime.now()
@@ -101,22 +183,70 @@ class Tag(Model):
     def __str__(self):
         return self.id
 
+class CacheGeneration(Model):
+    """
+    A counter that is bumped whenever the rows behind an in-process cache
+    change, so that other processes notice and drop their copies; see
+    actionindex.py.
+    """
+    name = CharField(max_length=40, primary_key=True)
+    generation = IntegerField(default=0)
+
+    class Meta:
+        database = db
+
+    @classmethod
+    def current(cls, name):
+        return cls.select(cls.generation).where(cls.name == name).scalar() or 0
+
+    @classmethod
+    def bump(cls, name):
+        (cls.insert(name=name, generation=1)
+            .on_conflict(conflict_target=[cls.name],
+                         update={cls.generation: cls.generation + 1})
+            .execute())
+
 class Event(OrderedModel):
     user_id = CharField(max_length=100)
     client_ip = CharField(max_length=46, null=True)
     severity = CharField(max_length=10)
     event_text = CharField(max_length=255)
-    timestamp = DateTimeField(default=datetime.now)
+    timestamp = FastDateTimeField(default=datetime.now)
 
     class Meta:
         database = db
         order_by = ['-timestamp']
+        indexes = (
+            (('timestamp',), False),
+            (('severity', 'timestamp'), False),
+            (('user_id', 'timestamp'), False),
+            (('client_ip', 'timestamp'), False),
+        )
 
     def __str__(self):
         return str(self.timestamp) \
              + ', ' + self.severity + '/' + self.user_id \
              + ': ' + self.event_text
 
-# Create DB tables if they do not yet exist.
+class EventStat(Model):
+    """
+    Number of events per hour, severity and user; see eventstats.py.
+    """
+    bucket = FastDateTimeField()
+    severity = CharField(max_length=10)
+    user_id = CharField(max_length=100)
+    count = IntegerField(default=0)
+
+    class Meta:
+        database = db
+        primary_key = CompositeKey('bucket', 'severity', 'user_id')
+        indexes = (
+            (('severity', 'bucket'), False),
+            (('user_id', 'bucket'), False),
+        )
+
+# Create DB tables if they do not yet exist. On both Sqlite and Postgres,
+# this also adds any missing indexes to existing tables (using
+# CREATE INDEX IF NOT EXISTS).
 with db:
-    db.create_tables([User, Session, Action, Event, Tag])
+    db.create_tables([User, Session, Action, CacheGeneration, Event, EventStat, Tag])
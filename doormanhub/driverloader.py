@@ -0,0 +1,106 @@
+import os
+import sys
+import time
+import threading
+import importlib
+from . import const
+from .logs import debug, err
+
+driver_dir = os.path.join(os.path.dirname(__file__), 'drivers')
+
+def _load_driver(name):
+    print("Loading", name)
+
+    # Find and import the module.
+    #spec = finder.find_spec(name)
+    spec = importlib.util.find_spec(name)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    # Every driver needs a "driver" submodule; find it here.
+    driver = getattr(module, 'driver', None)
+    if driver is None:
+        raise ImportError('driver without a valid "driver" module')
+    return module
+
+def _init_driver(app, name, module, status):
+    start = time.perf_counter()
+    try:
+        # Find the entry point in the driver submodule.
+        on_init = getattr(module.driver, 'on_init', None)
+        if on_init is not None:
+            print("Calling", name + ".driver.on_init()")
+            debug('Calling', name+'.driver.on_init()')
+            on_init(app)
+    except Exception as e:
+        status.update(state='degraded', error=str(e))
+        err('Driver', name, 'failed to initialize:', e)
+    else:
+        app.drivers.append(module)
+        status.update(state='ok', error=None)
+        debug('Driver loaded successfully:', name)
+    status['seconds'] = round(status['seconds'] + time.perf_counter() - start, 3)
+
+def load_drivers(app, driver_dir):
+    """
+    Imports all drivers and initializes them concurrently, each in a
+    thread of its own, passing them the given app (which has "devices",
+    "drivers" and "driver_status" attributes). Waits at most
+    const.driver_init_timeout seconds for them; a driver that fails or
+    times out is marked degraded in app.driver_status instead of keeping
+    the hub from starting, and one that completes after the timeout
+    still becomes available.
+    """
+    driver_dirs = [o for o in os.listdir(driver_dir)
+                   if os.path.isdir(os.path.join(driver_dir, o))
+                   and not o.startswith(('_', '.'))]
+
+    # For some reason, spec.loader.exec_module() does not
+    # execute the module if it was found using a FileFinder.
+    # https://stackoverflow.com/questions/70219533/
+    # As a workaround, insert the driver dir to sys.path and use
+    # importlib.util.find_spec() instead.
+    sys.path.append(driver_dir)
+
+    #loader_details = (
+    #    importlib.machinery.ExtensionFileLoader,
+    #    importlib.machinery.EXTENSION_SUFFIXES
+    #)
+    #finder = importlib.machinery.FileFinder(driver_dir, loader_details)
+
+    # Drivers are imported one after another, since a thread that imports
+    # a module of this package while the package itself is still being
+    # imported would deadlock on the import lock. Only on_init(), which
+    # typically talks to the hardware, runs concurrently.
+    threads = []
+    for name in driver_dirs:
+        status = app.driver_status[name] = {'state': 'loading',
+                                            'seconds': None,
+                                            'error': None}
+        start = time.perf_counter()
+        try:
+            module = _load_driver(name)
+        except Exception as e:
+            status.update(state='degraded', error=str(e))
+            err('Driver', name, 'failed to load:', e)
+            continue
+        finally:
+            status['seconds'] = round(time.perf_counter() - start, 3)
+        thread = threading.Thread(target=_init_driver,
+                                  args=(app, name, module, status),
+                                  name='driver-init-' + name,
+                                  daemon=True)
+        thread.start()
+        threads.append((name, thread))
+
+    deadline = time.monotonic() + const.driver_init_timeout
+    for name, thread in threads:
+        thread.join(max(0, deadline - time.monotonic()))
+        if thread.is_alive():
+            app.driver_status[name].update(state='degraded', error='timed out')
+            err('Driver', name, 'did not initialize within',
+                const.driver_init_timeout, 'seconds')
+
+    for name, status in sorted(app.driver_status.items()):
+        debug('Driver', name + ':', status['state'],
+              '(' + str(status['seconds']) + 's)')
@@ -1,7 +1,10 @@
-from threading import Thread
+import threading
+from doormanhub import const
 from doormanhub.objects import Device, Actor
 from doormanhub.logs import debug
-from .hat import discover, switch, switch_temporary
+from doormanhub.scheduler import scheduler
+from doormanhub.worker import PeriodicTask
+from .hat import discover, read_states, switch
 
 device_names = {1: '1 relais HAT',
                 2: '2 relais HAT',
@@ -11,21 +14,66 @@ device_names = {1: '1 relais HAT',
 class Relais(Actor):
     def __init__(self, number, on):
         super(Relais, self).__init__(number, "Relais " + str(number))
-        self.on = on
+        self.on = bool(on)
 
     def to_dict(self):
         thedict = super(Relais, self).to_dict()
         thedict['on'] = self.on
         return thedict
 
+    def set_state(self, on):
+        on = bool(on)
+        if on != self.on:
+            self.on = on
+            self.changed()
+
+    def _switch(self, device, on):
+        switch(device.id, self.id, on)
+        self.set_state(on)
+
     def trigger(self, device, params):
+        # All relais share one scheduler thread. Overlapping temporary
+        # triggers of the same relais extend the time it stays switched.
         seconds = params.get('seconds', 0)
         on = bool(params.get('on', True))
+        key = device.id, self.id
         if seconds == 0:
-            Thread(target=switch, args=(device.id, self.id, on)).start()
+            scheduler.set(key, lambda: self._switch(device, on))
         else:
-            Thread(target=switch_temporary,
-                   args=(device.id, self.id, seconds, on)).start()
+            scheduler.hold(key, seconds,
+                           lambda: self._switch(device, on),
+                           lambda: self._switch(device, not on),
+                           state=on)
+
+_devices = []
+_pending_reads = set()
+_lock = threading.Lock()
+
+def _read_back(device):
+    with _lock:
+        _pending_reads.discard(device.id)
+    for number, on in enumerate(read_states(device.id), start=1):
+        relais = device.get_actor_from_id(str(number))
+        if relais is not None:
+            relais.set_state(on)
+
+def refresh(device):
+    """
+    Schedules a readback of the relais states of the given device, unless
+    one is pending already. Reads run on the scheduler thread, so they
+    are never interleaved with switching.
+    """
+    with _lock:
+        if device.id in _pending_reads:
+            return
+        _pending_reads.add(device.id)
+    scheduler.submit(lambda: _read_back(device))
+
+def refresh_all():
+    for device in _devices:
+        refresh(device)
+
+poller = PeriodicTask('relais-readback', const.hardware_poll_interval, refresh_all)
 
 def on_init(app):
     debug('discovering USB HID relais')
@@ -41,3 +89,6 @@ def on_init(app):
             relais = Relais(i, state)
             device.add_actor(relais)
         app.devices[device_id] = device
+        _devices.append(device)
+    if _devices and const.hardware_poll_interval > 0:
+        poller.start()
@@ -35,14 +35,17 @@ in which case number_of_relais is None.
 
 """
 def discover():
-    devices = []
-    relais1_on = GPIO.input(RELAIS1_GPIO)
-    relais2_on = GPIO.input(RELAIS2_GPIO)
-
     return [
-      (device_name, (relais1_on, relais2_on)),
+      (device_name, read_states(device_name)),
     ]
 
+def read_states(device_id):
+    """
+    Reads the current state of all relais of the given device from the
+    hardware, and returns it as a tuple of booleans.
+    """
+    return tuple(bool(GPIO.input(gpio)) for gpio in RELAIS_GPIOS)
+
 def switch(device_id, switch_id, on):
     switch_id = int(switch_id)
     gpio = RELAIS_GPIOS[switch_id - 1]
@@ -0,0 +1,101 @@
+import threading
+from collections import Counter
+from peewee import EXCLUDED, PostgresqlDatabase, chunked, fn
+from .db import db, Event, EventStat
+
+INTERVALS = ('hour', 'day')
+GROUP_FIELDS = ('severity', 'user_id')
+
+# Two rebuilds at the same time would count events twice.
+_rebuild_lock = threading.Lock()
+
+def get_bucket(timestamp):
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+def _add(counts):
+    rows = [{'bucket': bucket, 'severity': severity, 'user_id': user_id, 'count': n}
+            for (bucket, severity, user_id), n in counts.items()]
+    for chunk in chunked(rows, 100):
+        (EventStat.insert_many(chunk)
+                  .on_conflict(conflict_target=[EventStat.bucket,
+                                                EventStat.severity,
+                                                EventStat.user_id],
+                               update={EventStat.count: EventStat.count
+                                                        + EXCLUDED.count})
+                  .execute())
+
+def add(records):
+    """
+    Adds the given log records (see logs._make_record()) to the rollup.
+    Call this in the transaction that inserts the records, so that the
+    counts never disagree with the Event table.
+    """
+    _add(Counter((get_bucket(r['timestamp']), r['severity'], r['user_id'])
+                 for r in records))
+
+def rebuild(chunk_size=5000):
+    """
+    Recomputes the rollup from the Event table, e.g. after upgrading from
+    a version without it; events removed by the retention policy are no
+    longer counted. Returns the number of events counted.
+
+    The rollup is cleared in one short transaction, which also fixes the
+    last event to count; the log writer keeps counting the events after
+    it. Older events are then counted in chunks of chunk_size, each in a
+    transaction of its own, so the log writer is never blocked for long.
+    Until it finishes, event/stats reports counts that are too low.
+    """
+    with _rebuild_lock:
+        with db.atomic():
+            if isinstance(db, PostgresqlDatabase):
+                # Waits for the log writer's open transactions, so that
+                # all events up to last_id are visible.
+                db.execute_sql('LOCK TABLE {} IN SHARE MODE'.format(Event._meta.table_name))
+            EventStat.delete().execute()
+            last_id = Event.select(fn.MAX(Event.id)).order_by().scalar() or 0
+
+        total = 0
+        cursor = 0
+        while cursor < last_id:
+            query = (Event.select(Event.id, Event.timestamp, Event.severity, Event.user_id)
+                          .where((Event.id > cursor) & (Event.id <= last_id))
+                          .order_by(Event.id)
+                          .limit(chunk_size)
+                          .tuples())
+            counts = Counter()
+            for event_id, timestamp, severity, user_id in query:
+                counts[get_bucket(timestamp), severity, user_id] += 1
+                cursor = event_id
+            if not counts:
+                break
+            with db.atomic():
+                _add(counts)
+            total += sum(counts.values())
+        return total
+
+def query(interval='hour', group_by=(), where=()):
+    """
+    Returns the number of events per interval, and per value of the
+    fields in group_by, as a list of dicts ordered by bucket. The cost
+    depends on the number of buckets, not on the number of events.
+    """
+    fields = [getattr(EventStat, f) for f in group_by]
+    rows = (EventStat.select(EventStat.bucket, *fields, fn.SUM(EventStat.count))
+                     .group_by(EventStat.bucket, *fields)
+                     .order_by(EventStat.bucket, *fields)
+                     .tuples())
+    if where:
+        rows = rows.where(*where)
+    totals = Counter()
+    for row in rows:
+        bucket = row[0]
+        if interval == 'day':
+            bucket = bucket.replace(hour=0)
+        totals[(bucket,) + row[1:-1]] += int(row[-1])
+    result = []
+    for key in sorted(totals):
+        stat = dict(zip(group_by, key[1:]))
+        stat['bucket'] = key[0]
+        stat['count'] = totals[key]
+        result.append(stat)
+    return result
@@ -0,0 +1,83 @@
+import re
+import json
+import time
+import threading
+import urllib.request
+from google.auth import exceptions, jwt
+from . import const
+
+GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+
+class InvalidToken(Exception):
+    pass
+
+class CertCache(object):
+    """
+    Fetches the public certificates that Google signs ID tokens with, and
+    caches them until the expiry announced by the server (Cache-Control
+    max-age). The certificates are fetched on first use, not at import.
+    Forced refreshes happen at most once per min_refresh seconds, so
+    tokens with made-up key ids cannot make every login fetch them.
+    """
+    def __init__(self, url, default_max_age=3600, timeout=10, min_refresh=60):
+        self.url = url
+        self.default_max_age = default_max_age
+        self.timeout = timeout
+        self.min_refresh = min_refresh
+        self.fetches = 0
+        self._certs = None
+        self._expires = 0
+        self._fetched = None
+        self._lock = threading.Lock()
+
+    def _fetch(self):
+        with urllib.request.urlopen(self.url, timeout=self.timeout) as response:
+            certs = json.loads(response.read().decode('utf-8'))
+            cache_control = response.headers.get('Cache-Control', '')
+        match = re.search(r'max-age=(\d+)', cache_control)
+        max_age = int(match.group(1)) if match else self.default_max_age
+        self.fetches += 1
+        return certs, time.monotonic() + max_age
+
+    def get(self, refresh=False):
+        with self._lock:
+            now = time.monotonic()
+            if refresh and self._fetched is not None \
+                    and now - self._fetched < self.min_refresh:
+                refresh = False
+            if refresh or self._certs is None or now >= self._expires:
+                self._certs, self._expires = self._fetch()
+                self._fetched = now
+            return self._certs
+
+certs = CertCache(const.google_certs_url,
+                  min_refresh=const.google_certs_min_refresh)
+
+def verify_id_token(token):
+    """
+    Verifies the signature and the claims of a Google ID token locally,
+    and returns the claims. Raises InvalidToken if the token is invalid.
+    """
+    # Without an audience, jwt.decode() accepts tokens of any client.
+    if not const.google_client_id:
+        raise InvalidToken('GOOGLE_CLIENT_ID is not set')
+    try:
+        key_id = jwt.decode_header(token).get('kid')
+    except (ValueError, exceptions.GoogleAuthError) as e:
+        raise InvalidToken(str(e))
+
+    # Google rotates its keys; an unknown key id means our copy is outdated.
+    cached = certs.get()
+    if key_id not in cached:
+        cached = certs.get(refresh=True)
+
+    try:
+        claims = jwt.decode(token, certs=cached, audience=const.google_client_id)
+    except (ValueError, exceptions.GoogleAuthError) as e:
+        raise InvalidToken(str(e))
+
+    if claims.get('iss') not in GOOGLE_ISSUERS:
+        raise InvalidToken('wrong issuer: ' + str(claims.get('iss')))
+    if claims.get('email_verified') is False:
+        raise InvalidToken('email address is not verified')
+    return claims
@@ -0,0 +1,25 @@
+"""
+Gunicorn configuration for the hub:
+
+    gunicorn -c doormanhub/gunicorn_conf.py doormanhub:app
+
+By default, requests are served by one worker process with WEB_THREADS
+threads (the "gthread" worker class), so a slow request, such as sending
+a support mail, no longer blocks all other clients. For many concurrent
+long-lived connections (the server-sent event streams), WEB_WORKER_CLASS
+may be set to "gevent" instead; this requires the gevent package. With
+gthread, every open stream occupies one of the threads.
+"""
+import os
+
+bind = os.environ.get('WEB_BIND', '0.0.0.0:80')
+worker_class = os.environ.get('WEB_WORKER_CLASS', 'gthread')
+# Unless HWD_SOCKET points to the hardware daemon, every worker process
+# loads the drivers, so more than one worker must not be used then.
+workers = int(os.environ.get('WEB_WORKERS', 1))
+threads = int(os.environ.get('WEB_THREADS', 8))
+# Concurrent requests per gevent worker. Each request holds a database
+# connection, so keep DB_MAX_CONNECTIONS at least this high.
+worker_connections = int(os.environ.get('WEB_WORKER_CONNECTIONS', 100))
+timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+keepalive = int(os.environ.get('WEB_KEEPALIVE', 5))
@@ -1,15 +1,17 @@
-import os
-import sys
-import importlib
-from flask import Flask, render_template, jsonify, g, redirect, send_from_directory
+import time
+from flask import Flask, request, jsonify, g, redirect
 from flask_cors import CORS
-from . import const
-from .db import db, User
+from . import appstate, const, invalidation, metrics, retention, sessions
+from .actionindex import index as action_index
+from .assets import Assets
+from .db import db
+from .driverloader import driver_dir, load_drivers
+from .hwclient import HardwareClient, RegistryMirror
+from .objects import DeviceRegistry
 from .api import action, auth, hardware, info as infoapi, log, nfc, utility
 from .api.auth import attempt_auth, require_admin
 from .exceptions import InvalidUsage
-from .util import getserial
-from .logs import debug, info
+from .logs import debug
 from .version import __version__
 
 app = Flask(__name__, static_url_path='')
@@ -18,6 +20,9 @@ app.config['MEDIA_DIR'] = 'static'
 app.debug = True
 cors = CORS(app, resources={r"/*": {"origins": "*"}})
 
+app.assets = Assets(const.static_dir, const.asset_dir, app.config['MEDIA_DIR'])
+app.jinja_env.globals['asset_url'] = app.assets.url
+
 app.register_blueprint(infoapi.api, url_prefix='/api/info/1.0')
 app.register_blueprint(action.api, url_prefix='/api/action/1.0')
 app.register_blueprint(auth.api, url_prefix='/api/auth/1.0')
@@ -26,119 +31,114 @@ app.register_blueprint(log.api, url_prefix='/api/log/1.0')
 app.register_blueprint(nfc.api, url_prefix='/api/nfc/1.0')
 app.register_blueprint(utility.api, url_prefix='/api/utility/1.0')
 
-def load_drivers(driver_dir):
-    driver_dirs = [o for o in os.listdir(driver_dir)
-                   if os.path.isdir(os.path.join(driver_dir, o))]
-
-    # For some reason, spec.loader.exec_module() does not
-    # execute the module if it was found using a FileFinder.
-    # https://stackoverflow.com/questions/70219533/
-    # As a workaround, insert the driver dir to sys.path and use
-    # importlib.util.find_spec() instead.
-    sys.path.append(driver_dir)
-
-    #loader_details = (
-    #    importlib.machinery.ExtensionFileLoader,
-    #    importlib.machinery.EXTENSION_SUFFIXES
-    #)
-    #finder = importlib.machinery.FileFinder(driver_dir, loader_details)
-
-    for name in driver_dirs:
-        print("Loading", name)
-
-        # Find and import the module.
-        #spec = finder.find_spec(name)
-        spec = importlib.util.find_spec(name)
-        module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(module)
-
-        # Every driver needs a "driver" submodule; find it here.
-        app.drivers.append(module)
-        driver = getattr(module, 'driver')
-        if driver is None:
-            print(name + ': Driver without a valid "driver" module. Skipping.')
-            continue
-
-        # Find the entry point in the driver submodule.
-        on_init = getattr(driver, 'on_init')
-        if on_init is not None:
-            print("Calling", name + ".driver.on_init()")
-            debug('Calling', name+'.driver.on_init()')
-            on_init(app)
-        debug('Driver loaded successfully:', name)
-
 app.drivers = []
-app.devices = {}
-load_drivers(os.path.join(os.path.dirname(__file__), 'drivers'))
+app.driver_status = {}
+app.devices = DeviceRegistry()
+if const.hwd_socket:
+    # The drivers are owned by the hardware daemon (hwd.py), which also
+    # relays cache invalidations between the web workers.
+    hardware_client = HardwareClient(const.hwd_socket)
+    hardware_mirror = RegistryMirror(hardware_client,
+                                     app.devices,
+                                     app.driver_status)
+    hardware_mirror.start()
+    invalidation.start_relay(hardware_client)
+else:
+    load_drivers(app, driver_dir)
 driver_names = ', '.join([d.__name__ for d in app.drivers])
 device_names = ', '.join(app.devices.keys())
 
 debug('Drivers:', driver_names)
 debug('Devices:', device_names)
 
+with db:
+    action_index.warm(app.devices)
+
+if retention.policy:
+    retention.task.start()
+sessions.task.start()
+
 @app.errorhandler(InvalidUsage)
 def custom400(error):
     response = jsonify(error.to_dict())
     response.status_code = error.status_code
+    if error.headers:
+        response.headers.extend(error.headers)
     return response
 
 @app.before_request
 def before_request():
+    g.request_start = time.perf_counter()
+    metrics.start_request()
     g.user = None
+    db.connect(reuse_if_open=True)
     attempt_auth()
 
+@app.after_request
+def after_request(response):
+    start = g.get('request_start')
+    if start is not None:
+        endpoint = request.endpoint or 'unknown'
+        queries, db_time = metrics.end_request()
+        metrics.request_duration.observe(time.perf_counter() - start,
+                                         endpoint, response.status_code)
+        metrics.request_queries.observe(queries, endpoint)
+        metrics.request_db_time.observe(db_time, endpoint)
+    return response
+
 @app.teardown_request
 def teardown_request(exception):
-    db.close()
+    # Returns the connection to the pool.
+    if not db.is_closed():
+        db.close()
 
 @app.route('/')
 def login():
-    admin = User.get_or_none(User.is_active == True, User.is_admin == True)
-    if admin is None:
-        return render_template('init.html')
+    if not appstate.admin_exists():
+        return appstate.render_page('init.html')
     if g.user:
         return redirect('home')
-    return render_template('login.html')
+    return appstate.render_page('login.html')
 
 @app.route('/home')
 def events():
     if g.user.is_admin:
-        return render_template('events.html')
-    return render_template('mobile_home.html')
+        return appstate.render_page('events.html')
+    return appstate.render_page('mobile_home.html')
 
 @app.route('/users')
 @require_admin
 def users():
-    return render_template('users.html')
+    return appstate.render_page('users.html')
 
 @app.route('/actions')
 @require_admin
 def actions():
-    return render_template('actions.html')
+    return appstate.render_page('actions.html')
 
 @app.route('/tags')
 @require_admin
 def tags():
-    return render_template('tags.html')
+    return appstate.render_page('tags.html')
 
 @app.route('/devices')
 @require_admin
 def devices():
-    return render_template('devices.html')
+    return appstate.render_page('devices.html')
 
 @app.route('/about')
 @require_admin
 def about():
-    return render_template('about.html', serial=getserial())
+    return appstate.render_page('about.html', serial=appstate.serial())
 
 @app.route('/support')
 @require_admin
 def support():
-    return render_template('support.html')
+    return appstate.render_page('support.html')
 
-@app.route('/{}/<path>'.format(app.config['MEDIA_DIR']))
+@app.route('/{}/<path:path>'.format(app.config['MEDIA_DIR']))
 def send_js(path):
-    return send_from_directory(const.static_dir, path)
+    return app.assets.send(path)
 
 if __name__ == '__main__':
     app.run()
@@ -0,0 +1,121 @@
+import json
+import time
+import socket
+from . import const
+from .logs import err, info
+from .objects import Sensor, Actor, Device
+from .worker import PeriodicTask
+
+class HardwareError(Exception):
+    pass
+
+class HardwareClient(object):
+    """
+    Talks to the hardware daemon (see hwd.py), using one connection
+    per request.
+    """
+    def __init__(self, path, timeout=None):
+        self.path = path
+        self.timeout = const.hwd_timeout if timeout is None else timeout
+
+    def call(self, cmd, timeout=None, **args):
+        args['cmd'] = cmd
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout if timeout is None else timeout)
+        try:
+            sock.connect(self.path)
+            sock.sendall(json.dumps(args).encode('utf-8') + b'\n')
+            with sock.makefile('rb') as fp:
+                line = fp.readline()
+        finally:
+            sock.close()
+        if not line:
+            raise HardwareError('no response from the hardware daemon')
+        response = json.loads(line.decode('utf-8'))
+        if 'error' in response:
+            raise HardwareError(response['error'])
+        return response
+
+class RemoteActor(Actor):
+    def __init__(self, client, data):
+        super(RemoteActor, self).__init__(data['id'], data['name'])
+        self.client = client
+        self.data = data
+
+    def to_dict(self):
+        return self.data
+
+    def trigger(self, device, params):
+        self.client.call('trigger',
+                         device_id=device.id,
+                         actor_id=self.id,
+                         params=params)
+
+class RemoteDevice(Device):
+    def __init__(self, client, data):
+        super(RemoteDevice, self).__init__(data['id'], data['name'], data['interface'])
+        self.sensors = [Sensor(s['id'], s['name']) for s in data['sensors']]
+        for actor in data['actors']:
+            self.add_actor(RemoteActor(client, actor))
+
+class RegistryMirror(object):
+    """
+    Keeps a DeviceRegistry in sync with the registry of the hardware
+    daemon. A background thread long-polls the daemon for changes, so
+    that state changes show up without delay.
+    """
+    def __init__(self, client, registry, driver_status):
+        self.client = client
+        self.registry = registry
+        self.driver_status = driver_status
+        self.connected = None
+        self.task = PeriodicTask('hardware-mirror', 0, self.run_once)
+
+    def refresh(self, wait=0):
+        """
+        Fetches the device list, waiting up to the given number of seconds
+        if the local copy is current.
+        """
+        registry = self.registry
+        response = self.client.call('devices',
+                                    timeout=wait + self.client.timeout,
+                                    boot_id=registry.boot_id,
+                                    version=registry.version,
+                                    wait=wait)
+        if response['boot_id'] == registry.boot_id \
+           and response['version'] == registry.version:
+            return
+        devices = [RemoteDevice(self.client, d) for d in response['devices']]
+        registry.replace(devices, response['version'], response['boot_id'])
+        self.driver_status.clear()
+        self.driver_status.update(response['drivers'])
+
+    def _set_connected(self, connected, error=None):
+        if connected == self.connected:
+            return
+        self.connected = connected
+        if connected:
+            info('connected to hardware daemon at', self.client.path)
+        else:
+            err('hardware daemon at', self.client.path, 'is unavailable:', error)
+
+    def run_once(self):
+        try:
+            self.refresh(const.hwd_wait)
+        except (OSError, ValueError, HardwareError) as e:
+            self._set_connected(False, e)
+            time.sleep(const.hwd_retry_interval)
+        else:
+            self._set_connected(True)
+
+    def start(self):
+        """
+        Fetches the device list once, then starts the background thread.
+        """
+        try:
+            self.refresh()
+        except (OSError, ValueError, HardwareError) as e:
+            self._set_connected(False, e)
+        else:
+            self._set_connected(True)
+        self.task.start()
@@ -0,0 +1,136 @@
+"""
+The hardware daemon. It loads the drivers and owns their devices, and
+serves any number of web workers (or hubs on the same host) through a
+unix socket, so that only one process ever touches the hardware:
+
+    DOORMAN_ROLE=hwd HWD_SOCKET=/run/doorman/hwd.sock python -m doormanhub.hwd
+
+Web workers started with the same HWD_SOCKET then use the daemon instead
+of loading the drivers themselves.
+
+Every request and every response is one line of JSON. Requests:
+
+- {"cmd": "devices", "boot_id": ..., "version": ..., "wait": <seconds>}
+  Returns {"boot_id", "version", "devices", "drivers"}. If the given
+  boot_id and version are current, waits up to the given number of
+  seconds for a change first.
+- {"cmd": "trigger", "device_id": ..., "actor_id": ..., "params": {...}}
+  Triggers the actor, and returns {}.
+- {"cmd": "acquire", "limiter": ..., "key": ...}
+  Takes a token from one of the login rate limiters (see ratelimit.py),
+  and returns {"delay": <seconds to wait, or 0>}.
+- {"cmd": "invalidate", "name": ..., "key": ...}
+  Relays a cache invalidation to all web workers (see invalidation.py),
+  and returns {}.
+- {"cmd": "invalidations", "boot_id": ..., "version": ..., "wait": <seconds>}
+  Returns {"boot_id", "version", "invalidations"}, the invalidations
+  after the given version, waiting for one like "devices" does.
+
+Failed requests return {"error": <message>}.
+"""
+import os
+import sys
+import json
+import socketserver
+from . import const, ratelimit
+from .driverloader import driver_dir, load_drivers
+from .invalidation import InvalidationLog
+from .logs import debug, info, err
+from .objects import DeviceRegistry
+
+class Hardware(object):
+    # Stands in for the app that drivers are initialized with.
+    def __init__(self):
+        self.drivers = []
+        self.driver_status = {}
+        self.devices = DeviceRegistry()
+        self.invalidations = InvalidationLog()
+
+    def get_devices(self, boot_id=None, version=None, wait=0):
+        devices = self.devices
+        if boot_id == devices.boot_id and version == devices.version:
+            devices.wait(version, min(wait, const.hwd_wait))
+        # Read the version first; if a device changes in the meantime,
+        # the client's next request returns immediately.
+        version = devices.version
+        return {'boot_id': devices.boot_id,
+                'version': version,
+                'devices': [d.to_dict() for d in list(devices.values())],
+                'drivers': self.driver_status}
+
+    def trigger(self, device_id, actor_id, params):
+        device = self.devices.get(device_id)
+        if device is None:
+            raise ValueError('unknown device id ' + str(device_id))
+        actor = device.get_actor_from_id(actor_id)
+        if actor is None:
+            raise ValueError('unknown actor id ' + str(actor_id))
+        actor.trigger(device, params)
+        return {}
+
+    def acquire(self, limiter, key):
+        return {'delay': ratelimit.limiters[limiter].acquire(key)}
+
+    def invalidate(self, name, key=None):
+        self.invalidations.add(name, key)
+        return {}
+
+    def get_invalidations(self, boot_id=None, version=None, wait=0):
+        version, invalidations = self.invalidations.since(
+            boot_id, version, min(wait, const.hwd_wait))
+        return {'boot_id': self.invalidations.boot_id,
+                'version': version,
+                'invalidations': invalidations}
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        hardware = self.server.hardware
+        for line in self.rfile:
+            try:
+                request = json.loads(line.decode('utf-8'))
+                cmd = request.pop('cmd', None)
+                if cmd == 'devices':
+                    response = hardware.get_devices(**request)
+                elif cmd == 'trigger':
+                    response = hardware.trigger(**request)
+                elif cmd == 'acquire':
+                    response = hardware.acquire(**request)
+                elif cmd == 'invalidate':
+                    response = hardware.invalidate(**request)
+                elif cmd == 'invalidations':
+                    response = hardware.get_invalidations(**request)
+                else:
+                    response = {'error': 'unknown command: ' + str(cmd)}
+            except Exception as e:
+                err('hardware daemon: request failed:', e)
+                response = {'error': str(e)}
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+def main():
+    if 'doormanhub.hub' in sys.modules:
+        sys.exit('the web app was imported; set DOORMAN_ROLE=hwd')
+    if not const.hwd_socket:
+        sys.exit('HWD_SOCKET is not set')
+
+    hardware = Hardware()
+    load_drivers(hardware, driver_dir)
+    debug('Hardware daemon devices:', ', '.join(hardware.devices.keys()))
+
+    if os.path.exists(const.hwd_socket):
+        os.unlink(const.hwd_socket)
+    server = Server(const.hwd_socket, RequestHandler)
+    server.hardware = hardware
+    info('hardware daemon listening on', const.hwd_socket)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(const.hwd_socket)
+
+if __name__ == '__main__':
+    main()
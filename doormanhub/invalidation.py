@@ -0,0 +1,132 @@
+"""
+Cache invalidation across web workers.
+
+In-process caches register a handler under a name. invalidate() runs the
+handler in this process and, if a hardware daemon is used (HWD_SOCKET),
+sends the invalidation to the daemon, which relays it to all other
+workers. Workers long-poll the daemon for invalidations, like they do
+for device changes (see hwclient.RegistryMirror).
+"""
+import os
+import time
+import threading
+from collections import deque
+from . import const
+from .hwclient import HardwareError
+from .logs import err
+from .worker import PeriodicTask
+
+handlers = {}
+
+def register(name, func):
+    """
+    Registers func(key), which drops the cache entry with the given key,
+    or all entries if key is None.
+    """
+    handlers[name] = func
+
+def _run(name, key=None):
+    func = handlers.get(name)
+    if func is not None:
+        func(key)
+
+def broadcast(name, key=None):
+    """
+    Sends an invalidation to the other workers only.
+    """
+    if relay is not None:
+        relay.send(name, key)
+
+def invalidate(name, key=None):
+    _run(name, key)
+    broadcast(name, key)
+
+class InvalidationLog(object):
+    """
+    The daemon's side: numbers all invalidations, and keeps the last
+    maxlen of them for the workers that poll for them.
+    """
+    def __init__(self, maxlen=1000):
+        self.boot_id = os.urandom(4).hex()
+        self.version = 0
+        self._log = deque(maxlen=maxlen)  # (version, name, key)
+        self._cond = threading.Condition()
+
+    def add(self, name, key=None):
+        with self._cond:
+            self.version += 1
+            self._log.append((self.version, name, key))
+            self._cond.notify_all()
+
+    def since(self, boot_id, version, wait=0):
+        """
+        Returns the current version, and the invalidations after the given
+        version as [name, key] pairs. If the given boot_id and version are
+        current, waits up to the given number of seconds for one first.
+        Returns None instead of a list if the invalidations are no longer
+        known; the caller must then drop all of its caches.
+        """
+        with self._cond:
+            if boot_id == self.boot_id and version == self.version:
+                self._cond.wait(wait)
+            if boot_id != self.boot_id or version is None or version > self.version:
+                return self.version, None
+            if version < self.version and self._log[0][0] > version + 1:
+                return self.version, None
+            return self.version, [[n, k] for v, n, k in self._log if v > version]
+
+class InvalidationRelay(object):
+    """
+    The worker's side: sends invalidations to the daemon, and runs the
+    invalidations of other workers from a background thread.
+    """
+    def __init__(self, client):
+        self.client = client
+        self.boot_id = None
+        self.version = None
+        self.task = PeriodicTask('cache-invalidation', 0, self.run_once)
+
+    def send(self, name, key=None):
+        try:
+            self.client.call('invalidate', timeout=1, name=name, key=key)
+        except (OSError, ValueError, HardwareError) as e:
+            err('cache invalidation', name, 'was not sent to the hardware daemon:', e)
+
+    def poll(self, wait=0):
+        response = self.client.call('invalidations',
+                                    timeout=wait + self.client.timeout,
+                                    boot_id=self.boot_id,
+                                    version=self.version,
+                                    wait=wait)
+        invalidations = response['invalidations']
+        if invalidations is None:
+            for name in list(handlers):
+                _run(name)
+        else:
+            for name, key in invalidations:
+                _run(name, key)
+        self.boot_id = response['boot_id']
+        self.version = response['version']
+
+    def run_once(self):
+        try:
+            self.poll(const.hwd_wait)
+        except (OSError, ValueError, HardwareError):
+            # Invalidations may be missed until we are connected again,
+            # so start over then. RegistryMirror logs the outage.
+            self.boot_id = None
+            time.sleep(const.hwd_retry_interval)
+
+    def start(self):
+        try:
+            self.poll()
+        except (OSError, ValueError, HardwareError):
+            pass
+        self.task.start()
+
+relay = None
+
+def start_relay(client):
+    global relay
+    relay = InvalidationRelay(client)
+    relay.start()
@@ -1,5 +1,138 @@
+import os
+import sys
+import time
+import queue
+import atexit
+import threading
+from datetime import datetime
 from flask import request, g
-from .db import Event
+from . import const, eventstats
+from .db import db, Event
+from .notify import Notifier
+
+_STOP = object()
+
+# Notified whenever new events were written; see api.log.event_stream().
+events_written = Notifier()
+
+class EventWriter(object):
+    """
+    Queues log records and writes them to the Event table from a background
+    thread, using one INSERT per batch. A batch is written as soon as it
+    holds batch_size records, or flush_interval seconds after its first
+    record arrived, whichever comes first.
+
+    The queue is bounded: if the database cannot keep up, callers block for
+    at most queue_timeout seconds before the record is dropped (and counted).
+    """
+    def __init__(self, batch_size, flush_interval, queue_size, queue_timeout):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_timeout = queue_timeout
+        self.queue = queue.Queue(queue_size)
+        self.dropped = 0
+        self.written = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_started(self):
+        # Threads do not survive a fork (e.g. into gunicorn workers), so the
+        # writer is started lazily by the process that actually uses it.
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._thread = threading.Thread(target=self._run,
+                                            name='event-writer',
+                                            daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def put(self, record):
+        self._ensure_started()
+        try:
+            self.queue.put(record, timeout=self.queue_timeout)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def flush(self, timeout=None):
+        """
+        Blocks until all records that were queued before the call have
+        been written.
+        """
+        if self._pid != os.getpid():
+            return
+        marker = threading.Event()
+        self.queue.put(marker)
+        marker.wait(timeout)
+
+    def stop(self, timeout=5):
+        if self._pid != os.getpid():
+            return
+        self.queue.put(_STOP)
+        self._thread.join(timeout)
+        self._pid = None
+
+    def _collect(self):
+        """
+        Returns the next batch of records, and the control item (a flush
+        marker or _STOP) that ended the batch early, if any.
+        """
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            timeout = None
+            if deadline is not None:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if not isinstance(item, dict):
+                return batch, item
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+            batch.append(item)
+        return batch, None
+
+    def _run(self):
+        while True:
+            batch, control = self._collect()
+            self._write(batch)
+            if control is _STOP:
+                break
+            if control is not None:
+                control.set()
+
+    def _write(self, batch):
+        with self._lock:
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            batch.append(_make_record('system', None, 'error',
+                                      dropped, 'log records dropped'))
+        if not batch:
+            return
+        try:
+            with db.connection_context():
+                with db.atomic():
+                    Event.insert_many(batch).execute()
+                    eventstats.add(batch)
+            self.written += len(batch)
+            events_written.notify()
+        except Exception as e:
+            print('failed to write', len(batch), 'log records:', e,
+                  file=sys.stderr)
+
+writer = EventWriter(const.log_batch_size,
+                     const.log_flush_interval,
+                     const.log_queue_size,
+                     const.log_queue_timeout)
+atexit.register(writer.stop)
 
 def safe_str(*obj_list):
     result = []
@@ -10,6 +143,13 @@ def safe_str(*obj_list):
             result.append(str(obj))
     return ' '.join(result)
 
+def _make_record(uname, client_ip, severity, *msg):
+    return {'user_id': uname,
+            'client_ip': client_ip,
+            'severity': severity,
+            'event_text': safe_str(*msg),
+            'timestamp': datetime.now()}
+
 def log(user, severity, *msg):
     if isinstance(user, str):
         uname = user
@@ -26,10 +166,14 @@ def log(user, severity, *msg):
     except RuntimeError:
         client_ip = None
 
-    Event.create(user_id=uname,
-                 client_ip=client_ip,
-                 severity=severity,
-                 event_text=safe_str(*msg))
+    record = _make_record(uname, client_ip, severity, *msg)
+    if const.log_async:
+        writer.put(record)
+    else:
+        with db.atomic():
+            Event.create(**record)
+            eventstats.add([record])
+        events_written.notify()
 
 def debug(*msg):
     log(None, 'debug', *msg)
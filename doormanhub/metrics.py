@@ -0,0 +1,154 @@
+import bisect
+import threading
+
+# Seconds; roughly the Prometheus client defaults.
+TIME_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+registry = []
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names, values, extra=None):
+    pairs = ['{}="{}"'.format(n, _escape(v)) for n, v in zip(names, values)]
+    if extra is not None:
+        pairs.append('{}="{}"'.format(*extra))
+    if not pairs:
+        return ''
+    return '{' + ','.join(pairs) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric(object):
+    type = None
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        registry.append(self)
+
+    def render(self):
+        yield '# HELP {} {}'.format(self.name, self.description)
+        yield '# TYPE {} {}'.format(self.name, self.type)
+        for line in self.samples():
+            yield line
+
+class Counter(Metric):
+    type = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super(Counter, self).__init__(*args, **kwargs)
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            yield self.name + _format_labels(self.labels, label_values) \
+                + ' ' + _format_value(value)
+
+class Gauge(Metric):
+    """
+    A gauge whose value is obtained from a callback when it is rendered.
+    """
+    type = 'gauge'
+
+    def __init__(self, name, description, func):
+        super(Gauge, self).__init__(name, description)
+        self.func = func
+
+    def samples(self):
+        yield self.name + ' ' + _format_value(self.func())
+
+class CallbackCounter(Gauge):
+    """
+    A counter whose value is obtained from a callback when it is rendered,
+    for counts that are kept elsewhere and only ever go up.
+    """
+    type = 'counter'
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, description, labels=(), buckets=TIME_BUCKETS):
+        super(Histogram, self).__init__(name, description, labels)
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [bucket counts, sum, count]
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = sorted((k, (list(v[0]), v[1], v[2]))
+                            for k, v in self._values.items())
+        bounds = self.buckets + (float('inf'),)
+        for label_values, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels, label_values,
+                                        ('le', _format_value(bound)))
+                yield self.name + '_bucket' + labels + ' ' + str(cumulative)
+            labels = _format_labels(self.labels, label_values)
+            yield self.name + '_sum' + labels + ' ' + _format_value(float(total))
+            yield self.name + '_count' + labels + ' ' + str(count)
+
+def render():
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+request_duration = Histogram('doorman_request_duration_seconds',
+                             'Time spent handling a request.',
+                             ('endpoint', 'status'))
+request_queries = Histogram('doorman_request_db_queries',
+                            'Number of database queries per request.',
+                            ('endpoint',), COUNT_BUCKETS)
+request_db_time = Histogram('doorman_request_db_seconds',
+                            'Time spent in database queries per request.',
+                            ('endpoint',))
+db_queries = Counter('doorman_db_queries_total',
+                     'Database queries, including those of background threads.')
+driver_trigger_duration = Histogram('doorman_driver_trigger_seconds',
+                                    'Duration of driver trigger() calls.',
+                                    ('device', 'actor'))
+
+# Per-thread [queries, db time] of the current request.
+_local = threading.local()
+
+def start_request():
+    _local.stats = [0, 0.0]
+
+def record_query(duration):
+    db_queries.inc()
+    stats = getattr(_local, 'stats', None)
+    if stats is not None:
+        stats[0] += 1
+        stats[1] += duration
+
+def end_request():
+    """
+    Returns the number of queries and the database time of the request.
+    """
+    stats = getattr(_local, 'stats', None) or [0, 0.0]
+    _local.stats = None
+    return stats[0], stats[1]
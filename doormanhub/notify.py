@@ -0,0 +1,25 @@
+import threading
+
+class Notifier(object):
+    """
+    A change counter that threads can wait on. Producers call notify()
+    after each change; consumers remember the version they have seen and
+    call wait() to block until it is outdated.
+    """
+    def __init__(self):
+        self.version = 0
+        self._cond = threading.Condition()
+
+    def notify(self):
+        with self._cond:
+            self.version += 1
+            self._cond.notify_all()
+
+    def wait(self, version, timeout=None):
+        """
+        Returns the current version as soon as it differs from the given
+        one, or after the timeout expired.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self.version != version, timeout)
+            return self.version
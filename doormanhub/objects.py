@@ -1,3 +1,7 @@
+import os
+import json
+import threading
+
 class Sensor(object):
     def __init__(self, theid, name):
         self.id = str(theid)
@@ -11,11 +15,20 @@ class Actor(object):
     def __init__(self, theid, name):
         self.id = str(theid)
         self.name = name
+        self.device = None
 
     def to_dict(self):
         return {'id': self.id,
                 'name': self.name}
 
+    def changed(self):
+        """
+        Must be called by drivers whenever the state returned by
+        to_dict() changes.
+        """
+        if self.device is not None:
+            self.device.changed()
+
     def trigger(self, device, params):
         raise NotImplementedError()
 
@@ -26,6 +39,7 @@ class Device(object):
         self.interface = interface
         self.sensors = []
         self.actors = {}
+        self.registry = None
 
     def to_dict(self):
         actors = [v.to_dict() for v in self.actors.values()]
@@ -35,8 +49,96 @@ class Device(object):
                 'sensors': [s.to_dict() for s in self.sensors],
                 'actors': actors}
 
+    def changed(self):
+        if self.registry is not None:
+            self.registry.changed()
+
     def add_actor(self, actor):
+        actor.device = self
         self.actors[str(actor.id)] = actor
+        self.changed()
 
     def get_actor_from_id(self, actor_id):
         return self.actors.get(actor_id)
+
+class DeviceRegistry(dict):
+    """
+    Maps device ids to devices. The version is incremented whenever a
+    device is added or removed, or reports a change of its state, so
+    that serialized snapshots of the registry can be cached until the
+    next change.
+    """
+    def __init__(self):
+        super(DeviceRegistry, self).__init__()
+        self.version = 0
+        # Distinguishes versions of different hub processes and restarts.
+        self.boot_id = os.urandom(4).hex()
+        self._snapshots = {}  # key -> (version, json)
+        self._lock = threading.RLock()
+        self._cond = threading.Condition(self._lock)
+
+    def __setitem__(self, device_id, device):
+        with self._lock:
+            device.registry = self
+            super(DeviceRegistry, self).__setitem__(device_id, device)
+            self.changed()
+
+    def __delitem__(self, device_id):
+        with self._lock:
+            self[device_id].registry = None
+            super(DeviceRegistry, self).__delitem__(device_id)
+            self.changed()
+
+    def changed(self):
+        with self._lock:
+            self.version += 1
+            self._cond.notify_all()
+
+    def replace(self, devices, version=None, boot_id=None):
+        """
+        Replaces all devices at once. A mirror of the registry of another
+        process passes its version and boot id, so that all processes
+        produce the same ETags.
+        """
+        with self._lock:
+            for device in self.values():
+                device.registry = None
+            super(DeviceRegistry, self).clear()
+            for device in devices:
+                device.registry = self
+                super(DeviceRegistry, self).__setitem__(device.id, device)
+            if boot_id is not None:
+                self.boot_id = boot_id
+            if version is None:
+                version = self.version + 1
+            self.version = version
+            self._snapshots = {}
+            self._cond.notify_all()
+
+    def wait(self, version, timeout=None):
+        """
+        Blocks until the registry version differs from the given one, or
+        until the timeout expired, and returns the current version.
+        """
+        with self._lock:
+            self._cond.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def etag(self, key):
+        return '{}-{}-{}'.format(self.boot_id, self.version, key)
+
+    def snapshot(self, key, build):
+        """
+        Returns a tuple (etag, json), where json is the serialized result
+        of build(). The result is cached under the given key until the
+        registry changes.
+        """
+        with self._lock:
+            version = self.version
+            cached = self._snapshots.get(key)
+            if cached is not None and cached[0] == version:
+                return self.etag(key), cached[1]
+            data = json.dumps(build())
+            if self.version == version:
+                self._snapshots[key] = version, data
+            return self.etag(key), data
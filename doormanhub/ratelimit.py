@@ -0,0 +1,134 @@
+import time
+import threading
+from collections import OrderedDict
+from . import const
+from .logs import err
+from .worker import PeriodicTask
+
+class RateLimiter(object):
+    """
+    In-memory token bucket rate limiter, with one bucket per key. A bucket
+    holds up to burst tokens, and refills at rate tokens per second. The
+    least recently used buckets are dropped if there are more than maxsize.
+    """
+    def __init__(self, name, rate, burst, maxsize=10000):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.maxsize = maxsize
+        self.rejected = 0
+        self._buckets = OrderedDict()  # key -> [tokens, last update]
+        self._lock = threading.Lock()
+
+    def acquire(self, key):
+        """
+        Takes a token from the bucket of the given key. Returns 0 if one
+        was available, or else the number of seconds until there is one.
+        """
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now]
+                if len(self._buckets) > self.maxsize:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0
+            self.rejected += 1
+            return (1 - bucket[0]) / self.rate
+
+limiters = {}
+
+def _limiter(name, per_minute, burst):
+    limiters[name] = RateLimiter(name, per_minute / 60.0, burst,
+                                 const.login_limiter_size)
+    return limiters[name]
+
+login_ip = _limiter('login-ip', const.login_ip_per_minute, const.login_ip_burst)
+login_email = _limiter('login-email', const.login_email_per_minute, const.login_email_burst)
+
+_client = None
+
+def acquire(limiter, key):
+    """
+    Like limiter.acquire(key), except that with a hardware daemon
+    (HWD_SOCKET), the daemon's limiters are used, so that the limits hold
+    across all web workers. If the daemon is unavailable, the local
+    limiter is used instead.
+    """
+    global _client
+    if not const.hwd_socket:
+        return limiter.acquire(key)
+    from .hwclient import HardwareClient, HardwareError
+    if _client is None:
+        _client = HardwareClient(const.hwd_socket)
+    try:
+        return _client.call('acquire', timeout=1, limiter=limiter.name,
+                            key=key)['delay']
+    except (OSError, ValueError, HardwareError):
+        return limiter.acquire(key)
+
+class FailureReport(object):
+    """
+    Coalesces failed logins into summarized events: the first failure per
+    email address and client IP is logged right away, and all others in
+    the same interval are counted and reported as one event. Once maxsize
+    pairs are tracked, failures of further pairs are only counted in total.
+    """
+    def __init__(self, interval, maxsize=10000):
+        self.maxsize = maxsize
+        self._counts = {}  # (email, client_ip) -> [failed, rejected]
+        self._overflow = [0, 0]
+        self._lock = threading.Lock()
+        self.task = PeriodicTask('login-failure-report', interval, self.flush)
+
+    def failed(self, email, client_ip):
+        """
+        Returns True if the failure should be logged by the caller.
+        """
+        self.task.start()
+        with self._lock:
+            counts = self._counts.get((email, client_ip))
+            if counts is None:
+                if len(self._counts) >= self.maxsize:
+                    self._overflow[0] += 1
+                    return False
+                self._counts[email, client_ip] = [0, 0]
+                return True
+            counts[0] += 1
+            return False
+
+    def rejected(self, email, client_ip):
+        self.task.start()
+        with self._lock:
+            counts = self._counts.get((email, client_ip))
+            if counts is None:
+                if len(self._counts) >= self.maxsize:
+                    counts = self._overflow
+                else:
+                    counts = self._counts[email, client_ip] = [0, 0]
+            counts[1] += 1
+
+    def flush(self):
+        with self._lock:
+            counts, self._counts = self._counts, {}
+            overflow, self._overflow = self._overflow, [0, 0]
+        lines = []
+        for (email, client_ip), (failed, rejected) in counts.items():
+            if not failed and not rejected:
+                continue
+            lines.append('{} from {}: {} more failed, {} rate limited'.format(
+                         email, client_ip, failed, rejected))
+        if any(overflow):
+            lines.append('other addresses: {} failed, {} rate limited'.format(
+                         *overflow))
+        if lines:
+            err('repeated login failures:', '; '.join(lines))
+
+failures = FailureReport(const.login_failure_report_interval,
+                         const.login_limiter_size)
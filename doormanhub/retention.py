@@ -0,0 +1,100 @@
+import os
+import gzip
+import json
+import time
+from datetime import datetime, timedelta
+from peewee import SqliteDatabase, PostgresqlDatabase
+from . import const
+from .db import db, Event
+from .logs import info
+from .worker import PeriodicTask
+
+def parse_policy(spec):
+    """
+    Parses a retention policy such as "debug=7,info=365,error=0" into a
+    dict that maps each severity to the maximum age of its events.
+    A value of 0 keeps events forever; so do severities not mentioned.
+    """
+    policy = {}
+    for item in spec.split(','):
+        if not item.strip():
+            continue
+        severity, _, days = item.partition('=')
+        try:
+            days = int(days)
+        except ValueError:
+            raise ValueError('invalid event retention policy: ' + item)
+        if days > 0:
+            policy[severity.strip()] = timedelta(days=days)
+    return policy
+
+policy = parse_policy(const.event_retention)
+
+def _archive(rows):
+    # One gzip member is appended per batch; gzip readers
+    # transparently concatenate them.
+    by_date = {}
+    for row in rows:
+        by_date.setdefault(row.timestamp.date(), []).append(row)
+    for date, date_rows in by_date.items():
+        filename = os.path.join(const.event_archive_dir,
+                                'events-' + date.isoformat() + '.ndjson.gz')
+        with gzip.open(filename, 'at', encoding='utf-8') as fp:
+            for row in date_rows:
+                fp.write(json.dumps({'id': row.id,
+                                     'timestamp': row.timestamp.isoformat(' '),
+                                     'severity': row.severity,
+                                     'user_id': row.user_id,
+                                     'client_ip': row.client_ip,
+                                     'event_text': row.event_text}) + '\n')
+
+def purge(severity, cutoff):
+    """
+    Deletes (and optionally archives) all events of the given severity
+    that are older than cutoff. Rows are removed in batches of
+    const.event_retention_batch_size, each in a short transaction of its
+    own, so that requests are never blocked for long.
+    """
+    removed = 0
+    while True:
+        batch = (Event.select(Event.id)
+                      .where(Event.severity == severity,
+                             Event.timestamp < cutoff)
+                      .order_by(Event.timestamp)
+                      .limit(const.event_retention_batch_size))
+        with db.atomic():
+            if const.event_archive_dir:
+                _archive(Event.select().where(Event.id.in_(batch)))
+            count = Event.delete().where(Event.id.in_(batch)).execute()
+        if not count:
+            break
+        removed += count
+        time.sleep(const.event_retention_pause)
+    return removed
+
+def compact():
+    if isinstance(db, SqliteDatabase):
+        db.execute_sql('VACUUM')
+    elif isinstance(db, PostgresqlDatabase):
+        db.execute_sql('ANALYZE ' + Event._meta.table_name)
+
+def run():
+    if const.event_archive_dir:
+        os.makedirs(const.event_archive_dir, exist_ok=True)
+
+    now = datetime.now()
+    removed = {}
+    with db.connection_context():
+        for severity, max_age in policy.items():
+            count = purge(severity, now - max_age)
+            if count:
+                removed[severity] = count
+        if removed:
+            compact()
+
+    if removed:
+        info('expired events removed:',
+             ', '.join(k + '=' + str(v) for k, v in sorted(removed.items())))
+    return removed
+
+task = PeriodicTask('event-retention', const.event_retention_interval, run)
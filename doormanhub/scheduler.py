@@ -0,0 +1,134 @@
+import os
+import sys
+import time
+import heapq
+import atexit
+import itertools
+import threading
+import traceback
+
+class Scheduler(object):
+    """
+    Executes commands for any number of resources (such as relays) from
+    a single thread, using a timer heap. Commands run one at a time, in
+    the order in which they were submitted.
+
+    A resource can be "held" in a temporary state; see hold(). Holds are
+    tracked per key, so that overlapping temporary requests for the same
+    resource extend each other instead of racing.
+    """
+    def __init__(self, name='scheduler'):
+        self.name = name
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._holds = {}  # key -> [deadline, state, release]; scheduler thread only
+        self._stopping = False
+        self._thread = None
+        self._pid = None
+
+    def _ensure_started(self):
+        # Threads do not survive a fork, so the scheduler is started
+        # lazily by the process that uses it.
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._heap = []
+            self._holds = {}
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run,
+                                            name=self.name,
+                                            daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def call_at(self, due, func):
+        self._ensure_started()
+        with self._cond:
+            heapq.heappush(self._heap, (due, next(self._seq), func))
+            self._cond.notify()
+
+    def submit(self, func):
+        self.call_at(time.monotonic(), func)
+
+    def set(self, key, func):
+        """
+        Runs func(), a permanent state change of the given resource,
+        cancelling any pending hold.
+        """
+        def run():
+            self._holds.pop(key, None)
+            func()
+        self.submit(run)
+
+    def hold(self, key, seconds, start, release, state=None):
+        """
+        Runs start() now and release() after the given number of seconds.
+        If the resource is already held in the same state, start() is not
+        repeated; instead, the hold is extended to whichever deadline is
+        later. A hold in a different state replaces the current one.
+        """
+        def run():
+            deadline = time.monotonic() + seconds
+            current = self._holds.get(key)
+            if current is not None and current[1] == state:
+                if deadline <= current[0]:
+                    return
+                current[0] = deadline
+            else:
+                self._holds[key] = [deadline, state, release]
+                start()
+            self.call_at(deadline, lambda: self._release(key))
+        self.submit(run)
+
+    def _release(self, key):
+        current = self._holds.get(key)
+        if current is None or current[0] > time.monotonic():
+            return  # cancelled, replaced or extended in the meantime
+        del self._holds[key]
+        current[2]()
+
+    def _release_all(self):
+        holds, self._holds = self._holds, {}
+        for _, _, release in holds.values():
+            self._call(release)
+
+    def stop(self, timeout=5):
+        """
+        Runs all pending commands that are due, releases all holds, and
+        stops the thread. Resources are never left in a temporary state.
+        """
+        if self._pid != os.getpid():
+            return
+        self.submit(self._release_all)
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        self._pid = None
+
+    def _call(self, func):
+        try:
+            func()
+        except Exception:
+            print(self.name + ': command failed', file=sys.stderr)
+            traceback.print_exc()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    if self._heap and self._heap[0][0] <= now:
+                        _, _, func = heapq.heappop(self._heap)
+                        break
+                    if self._stopping:
+                        return
+                    timeout = self._heap[0][0] - now if self._heap else None
+                    self._cond.wait(timeout)
+            self._call(func)
+
+scheduler = Scheduler()
+atexit.register(scheduler.stop)
@@ -0,0 +1,48 @@
+import time
+from datetime import datetime
+from . import const
+from .db import db, Session
+from .logs import info
+from .worker import PeriodicTask
+
+def sweep():
+    """
+    Deletes all expired sessions, in batches of
+    const.session_sweep_batch_size, each in a transaction of its own.
+    """
+    removed = 0
+    now = datetime.now()
+    with db.connection_context():
+        while True:
+            batch = (Session.select(Session.id)
+                            .where(Session.expires < now)
+                            .limit(const.session_sweep_batch_size))
+            with db.atomic():
+                count = Session.delete().where(Session.id.in_(batch)).execute()
+            if not count:
+                break
+            removed += count
+            time.sleep(const.session_sweep_pause)
+    if removed:
+        info('expired sessions removed:', removed)
+    return removed
+
+def evict_oldest(user, keep=None):
+    """
+    Deletes the oldest sessions of the given user, so that at most keep
+    (default: const.max_sessions_per_user) remain. Returns the ids of
+    the deleted sessions.
+    """
+    if keep is None:
+        keep = const.max_sessions_per_user
+    if keep <= 0:
+        return []
+    evicted = [s.id for s in Session.select(Session.id)
+                                    .where(Session.user == user)
+                                    .order_by(Session.created.desc())
+                                    .offset(keep)]
+    if evicted:
+        Session.delete().where(Session.id.in_(evicted)).execute()
+    return evicted
+
+task = PeriodicTask('session-sweeper', const.session_sweep_interval, sweep)
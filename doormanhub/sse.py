@@ -0,0 +1,76 @@
+"""
+Helpers for server-sent event streams (text/event-stream).
+"""
+import time
+import threading
+from flask import Response, request
+from . import const
+from .exceptions import InvalidUsage
+
+_lock = threading.Lock()
+open_streams = 0
+
+def message(data, event=None, id=None):
+    lines = []
+    if id is not None:
+        lines.append('id: ' + str(id))
+    if event is not None:
+        lines.append('event: ' + event)
+    lines.extend('data: ' + line for line in data.split('\n'))
+    return '\n'.join(lines) + '\n\n'
+
+def keepalive():
+    return ': keepalive\n\n'
+
+def last_event_id():
+    """
+    Returns the id of the last event that the client received, as sent
+    by EventSource when it reconnects, or passed as "last_id" argument.
+    """
+    return request.headers.get('Last-Event-ID', request.args.get('last_id'))
+
+def _release():
+    global open_streams
+    with _lock:
+        open_streams -= 1
+
+def stream(wait, poll, retry=3000):
+    """
+    Returns a streaming response that yields the messages returned by
+    poll() until the client disconnects, or for at most
+    const.stream_max_duration seconds. Between two polls, wait() is
+    called with a timeout and should block until there is news.
+    Keepalive comments are sent whenever nothing was sent for
+    const.stream_keepalive seconds.
+
+    Fails with 503 if const.stream_max_clients streams are open already.
+    """
+    global open_streams
+    with _lock:
+        if open_streams >= const.stream_max_clients:
+            raise InvalidUsage('too many open streams', 503)
+        open_streams += 1
+
+    def generate():
+        yield 'retry: {}\n\n'.format(retry)
+        end = time.monotonic() + const.stream_max_duration
+        last_sent = time.monotonic()
+        while time.monotonic() < end:
+            messages = poll()
+            if messages:
+                yield ''.join(messages)
+                last_sent = time.monotonic()
+                continue
+            idle = time.monotonic() - last_sent
+            if idle >= const.stream_keepalive:
+                yield keepalive()
+                last_sent = time.monotonic()
+                idle = 0
+            wait(min(const.stream_keepalive - idle, end - time.monotonic()))
+
+    response = Response(generate(), mimetype='text/event-stream')
+    # Runs when the server closes the response, even if it never started.
+    response.call_on_close(_release)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # for nginx
+    return response
@@ -6,34 +6,13 @@ var DoormanHub = function(api_url) {
         return url + "?" + $.param(params);
     };
 
-    this.get = function(action, params, on_success, on_error) {
-        var url = this._mkurl(action, params);
-        $.getJSON(url, function(data, status) {
-            if (status !== "success") {
-                on_error(data.status, JSON.stringify(data));
-                return;
-            }
-            if (typeof(data) === 'undefined' || isNaN(data.status)) {
-                on_error(null, JSON.stringify(data));
-                return;
-            }
-            if (Math.floor(data.status / 100) == 2)
-                on_success(data);
-            else
-                on_error(data.status, data.msg);
-        });
-    };
-    
-    this.post = function(action, get_params, post_params, on_success, on_error) {
-        post_params = post_params ? post_params : {};
-        var url = this._mkurl(action, get_params);
-        var post_data = JSON.stringify(post_params);
-        $.ajax({
-            'url': url,
-            'type': 'post',
-            'dataType': 'json',
-            'contentType': 'application/json; charset=utf-8',
-            'data': post_data}).done(function(data, status){
+    this._request = function(type, url, data, on_success, on_error) {
+        var settings = {'url': url, 'type': type, 'dataType': 'json'};
+        if (typeof data !== 'undefined') {
+            settings.contentType = 'application/json; charset=utf-8';
+            settings.data = data;
+        }
+        $.ajax(settings).done(function(data, status){
             if (status !== "success") {
                 on_error(data.status, data.msg);
                 return;
@@ -51,6 +30,19 @@ var DoormanHub = function(api_url) {
         });
     };
 
+    // GET responses may be cached by the browser and revalidated with
+    // their ETag, so use get() for lists that rarely change.
+    this.get = function(action, params, on_success, on_error) {
+        this._request('get', this._mkurl(action, params), undefined,
+                      on_success, on_error);
+    };
+
+    this.post = function(action, get_params, post_params, on_success, on_error) {
+        post_params = post_params ? post_params : {};
+        this._request('post', this._mkurl(action, get_params),
+                      JSON.stringify(post_params), on_success, on_error);
+    };
+
     this.call = function(api, params, on_success, on_error) {
         this.post(api, undefined, params, on_success, on_error);
     };
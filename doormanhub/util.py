@@ -47,7 +47,8 @@ def _start_suidtool(name):
     cmd = os.path.join(os.path.dirname(__file__), '..', 'suidtools', name)
     child = subprocess.Popen([cmd],
                              stdout=subprocess.PIPE,
-                             stderr=subprocess.PIPE)
+                             stderr=subprocess.PIPE,
+                             universal_newlines=True)
     output, err = child.communicate()
     if child.returncode != 0:
         return name + ' quit with exit code ' + str(child.returncode) + ': ' + err
@@ -0,0 +1,65 @@
+import os
+import sys
+import atexit
+import threading
+import traceback
+
+class PeriodicTask(object):
+    """
+    Calls func() every interval seconds from a daemon thread. The first
+    call happens after the first interval, unless trigger() is used to
+    request an immediate run.
+    """
+    def __init__(self, name, interval, func):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.runs = 0
+        self.last_error = None
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def start(self):
+        # Threads do not survive a fork, so every process that calls
+        # start() gets its own thread.
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run,
+                                            name=self.name,
+                                            daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+        atexit.register(self.stop)
+
+    def trigger(self):
+        self._wakeup.set()
+
+    def stop(self, timeout=5):
+        if self._pid != os.getpid():
+            return
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+        self._pid = None
+
+    def run_once(self):
+        try:
+            self.func()
+        except Exception as e:
+            self.last_error = str(e)
+            print(self.name + ': task failed', file=sys.stderr)
+            traceback.print_exc()
+        self.runs += 1
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            self.run_once()
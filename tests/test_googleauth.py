@@ -0,0 +1,159 @@
+import os
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+for name, value in (('CRYPTO_SALT', 'test'), ('SUPPORT_EMAIL', 'none@example.com'),
+                    ('SMTP_SERVER_AND_PORT', 'localhost:25'),
+                    ('SMTP_USER', ''), ('SMTP_PASSWORD', '')):
+    os.environ.setdefault(name, value)
+# Only the modules under test; importing the web app loads the drivers.
+os.environ['DOORMAN_ROLE'] = 'test'
+
+pytest.importorskip('cryptography')
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from datetime import datetime, timedelta
+from google.auth import crypt, jwt
+
+from doormanhub import const, googleauth
+
+CLIENT_ID = 'client.apps.googleusercontent.com'
+
+class Key(object):
+    def __init__(self, key_id):
+        self.key_id = key_id
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, key_id)])
+        now = datetime.utcnow()
+        cert = x509.CertificateBuilder() \
+            .subject_name(name).issuer_name(name) \
+            .public_key(key.public_key()) \
+            .serial_number(x509.random_serial_number()) \
+            .not_valid_before(now - timedelta(days=1)) \
+            .not_valid_after(now + timedelta(days=1)) \
+            .sign(key, hashes.SHA256())
+        self.cert = cert.public_bytes(serialization.Encoding.PEM).decode('ascii')
+        pem = key.private_bytes(serialization.Encoding.PEM,
+                                serialization.PrivateFormat.PKCS8,
+                                serialization.NoEncryption())
+        self.signer = crypt.RSASigner.from_string(pem, key_id)
+
+    def token(self, **claims):
+        now = int(time.time())
+        payload = {
+            'iss': 'https://accounts.google.com',
+            'aud': CLIENT_ID,
+            'sub': '1234',
+            'email': 'user@example.com',
+            'email_verified': True,
+            'iat': now,
+            'exp': now + 600,
+        }
+        payload.update(claims)
+        return jwt.encode(self.signer, payload).decode('ascii')
+
+class KeyServer(object):
+    """
+    Serves the certificates of the given keys, like Google's cert endpoint.
+    """
+    def __init__(self, keys, max_age=3600):
+        self.keys = list(keys)
+        self.max_age = max_age
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests += 1
+                body = json.dumps(dict((k.key_id, k.cert) for k in server.keys))
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Cache-Control',
+                                 'public, max-age={}'.format(server.max_age))
+                self.end_headers()
+                self.wfile.write(body.encode('utf-8'))
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}/certs'.format(self.httpd.server_port)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+@pytest.fixture(scope='module')
+def keys():
+    return Key('key1'), Key('key2')
+
+@pytest.fixture
+def server(keys, monkeypatch):
+    server = KeyServer(keys[:1])
+    monkeypatch.setattr(googleauth, 'certs',
+                        googleauth.CertCache(server.url, min_refresh=60))
+    monkeypatch.setattr(const, 'google_client_id', CLIENT_ID)
+    yield server
+    server.close()
+
+def test_valid_token(keys, server):
+    assert googleauth.certs.fetches == 0
+    for i in range(3):
+        claims = googleauth.verify_id_token(keys[0].token())
+        assert claims['email'] == 'user@example.com'
+    assert server.requests == 1
+
+def test_wrong_audience(keys, server):
+    with pytest.raises(googleauth.InvalidToken):
+        googleauth.verify_id_token(keys[0].token(aud='other.apps.googleusercontent.com'))
+
+def test_wrong_issuer(keys, server):
+    with pytest.raises(googleauth.InvalidToken):
+        googleauth.verify_id_token(keys[0].token(iss='https://example.com'))
+
+def test_expired(keys, server):
+    now = int(time.time())
+    with pytest.raises(googleauth.InvalidToken):
+        googleauth.verify_id_token(keys[0].token(iat=now - 7200, exp=now - 3600))
+
+def test_unverified_email(keys, server):
+    with pytest.raises(googleauth.InvalidToken):
+        googleauth.verify_id_token(keys[0].token(email_verified=False))
+
+def test_malformed(server):
+    with pytest.raises(googleauth.InvalidToken):
+        googleauth.verify_id_token('not a token')
+
+def test_key_rotation(keys, server):
+    googleauth.verify_id_token(keys[0].token())
+    googleauth.certs.min_refresh = 0
+    server.keys = list(keys)
+    googleauth.verify_id_token(keys[1].token())
+    assert server.requests == 2
+
+def test_unknown_key_refresh_is_throttled(keys, server):
+    googleauth.verify_id_token(keys[0].token())
+    for i in range(5):
+        with pytest.raises(googleauth.InvalidToken):
+            googleauth.verify_id_token(keys[1].token())
+    assert server.requests == 1
+
+def test_expired_certs_are_fetched_again(keys, server):
+    server.max_age = 0
+    googleauth.verify_id_token(keys[0].token())
+    googleauth.verify_id_token(keys[0].token())
+    assert server.requests == 2
+
+def test_client_id_required(keys, server, monkeypatch):
+    monkeypatch.setattr(const, 'google_client_id', None)
+    with pytest.raises(googleauth.InvalidToken):
+        googleauth.verify_id_token(keys[0].token(aud=None))
+    assert server.requests == 0